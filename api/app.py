@@ -1,13 +1,56 @@
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-import pickle
+from contextlib import asynccontextmanager
+from typing import List
+import asyncio
+import hmac
 import sys
-import pandas as pd
+import tempfile
+import time
 from src.exception import CustomException
+from src.serving.model_registry import ModelRegistry
+from src.utils.scoring import ScoringConfig, apply_threshold
+from src.serving.batch_scoring import BatchScoringConfig, UPLOAD_READERS, UploadError, iter_frame_chunks, iter_scored_chunks, open_scored_upload, score_records
+from src.serving.metrics import MetricsMiddleware, serving_metrics
+from src.serving.micro_batcher import MicroBatcher, MicroBatcherConfig
+from src.serving.prediction_cache import PredictionCache, cache_key
 
-app = FastAPI()
+registry = ModelRegistry()
+batch_config = BatchScoringConfig()
+scoring_config = ScoringConfig()
+# each batch is scored with the snapshot its requests were started with, never whatever is current
+micro_batcher = MicroBatcher(score_records, MicroBatcherConfig())
+serving_metrics.track_model(registry)
+prediction_cache = PredictionCache()
+
+if prediction_cache.cache_config.enabled:
+    # probabilities of the previous model are dropped as soon as a new one is swapped in
+    registry.on_load(prediction_cache.clear)
+    serving_metrics.track_cache(prediction_cache)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # loading the inference pipeline once for the whole process, unless the gunicorn master already did
+    if not registry.is_loaded:
+        registry.load()
+
+    watcher = None
+    if registry.registry_config.watch_interval > 0:
+        watcher = asyncio.create_task(registry.watch())
+
+    if micro_batcher.batcher_config.enabled:
+        await micro_batcher.start()
+
+    yield
+
+    await micro_batcher.stop()
+    if watcher is not None:
+        watcher.cancel()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,6 +60,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if serving_metrics.metrics_config.enabled:
+    # added last so it is the outermost middleware and times everything else
+    app.add_middleware(MetricsMiddleware, metrics=serving_metrics)
+
 class CustomerData(BaseModel):
     gender: str
     SeniorCitizen: str
@@ -38,29 +85,121 @@ class CustomerData(BaseModel):
     MonthlyCharges: float
     TotalCharges: float
 
+async def score_customer(loaded, customer_dict: dict) -> float:
+    if loaded.scorer is not None:
+        # fast path, scoring the dict directly without building a DataFrame
+        start = time.perf_counter()
+        probability = loaded.scorer.predict_proba(customer_dict)
+        serving_metrics.observe_phase('compiled_score', start)
+        serving_metrics.predictions.inc(1, ('compiled',))
+        return probability
+    if micro_batcher.batcher_config.enabled:
+        # coalescing concurrent requests into one vectorized call
+        return await micro_batcher.submit(loaded, customer_dict)
+    return (await run_in_threadpool(score_records, loaded, [customer_dict]))[0]
+
 @app.post('/predict')
-def predict(customer: CustomerData):
+async def predict(customer: CustomerData, request: Request):
     try:
-        # loading the preprocessors
-        with open('artifacts/preprocessor.pkl', 'rb') as f:
-            preprocessor = pickle.load(f)
+        serving_metrics.observe_validation(request)
 
-        # loading the model
-        with open('artifacts/models/model.pkl', 'rb') as f:
-            model = pickle.load(f)
+        # the same snapshot is used for the whole request, even if a reload happens meanwhile
+        loaded = registry.current()
 
+        # the cleaning of the raw values is part of the inference pipeline
         customer_dict = customer.dict()
-        customer_dict['SeniorCitizen'] = 1 if customer_dict['SeniorCitizen'].lower() == 'yes' else 0
 
-        df = pd.DataFrame([customer_dict])
-        processed_df = preprocessor.transform(df)
-        prediction = model.predict(processed_df)[0]
-        probability = model.predict_proba(processed_df)[0][1]
+        if prediction_cache.cache_config.enabled:
+            # keyed on the version of this snapshot, so a request racing a reload never mixes models
+            key = cache_key(customer_dict, loaded.version)
+            probability = prediction_cache.get(key)
+            if probability is None:
+                probability = await score_customer(loaded, customer_dict)
+                prediction_cache.put(key, float(probability))
+        else:
+            probability = await score_customer(loaded, customer_dict)
+
+        # the label is derived from the probability instead of a second model call
+        prediction = apply_threshold(probability, scoring_config.threshold)
 
         return {
             'prediction': int(prediction),
-            'probability': float(probability)
+            'probability': float(probability),
+            'threshold': scoring_config.threshold
+        }
+
+    except Exception as e:
+        raise CustomException(e, sys)
+
+@app.post('/predict/batch')
+def predict_batch(customers: List[CustomerData], request: Request):
+    try:
+        serving_metrics.observe_validation(request)
+
+        loaded = registry.current()
+
+        # scoring chunk by chunk, each chunk is one transform and one predict_proba call
+        records = [customer.dict() for customer in customers]
+        chunks = iter_frame_chunks(records, batch_config.chunk_size)
+
+        return StreamingResponse(iter_scored_chunks(loaded, chunks, scoring_config.threshold), media_type='application/x-ndjson')
+
+    except Exception as e:
+        raise CustomException(e, sys)
+
+@app.post('/predict/batch/file')
+async def predict_batch_file(request: Request):
+    content_type = request.headers.get('content-type', '').split(';')[0].strip()
+    if content_type not in UPLOAD_READERS:
+        raise HTTPException(status_code=415, detail=f'Unsupported upload type, expected one of {sorted(UPLOAD_READERS)}.')
+
+    upload = None
+    try:
+        loaded = registry.current()
+
+        # spooling the upload so large files are read back in chunks instead of held in memory
+        upload = tempfile.SpooledTemporaryFile(max_size=batch_config.spool_max_size)
+        async for part in request.stream():
+            upload.write(part)
+        upload.seek(0)
+
+        # the first chunk is parsed, checked and scored before the status is sent, the file is closed if it is rejected
+        results = open_scored_upload(loaded, upload, content_type, batch_config.chunk_size, scoring_config.threshold)
+
+        return StreamingResponse(results, media_type='application/x-ndjson')
+
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    except Exception as e:
+        if upload is not None:
+            upload.close()
+        raise CustomException(e, sys)
+
+@app.get('/metrics')
+def metrics():
+    if not serving_metrics.metrics_config.enabled:
+        raise HTTPException(status_code=404, detail='Metrics are disabled.')
+
+    return Response(serving_metrics.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.post('/reload')
+def reload_model(request: Request):
+    reload_token = registry.registry_config.reload_token
+    if not reload_token:
+        raise HTTPException(status_code=404, detail='Reloading is disabled, set MODEL_RELOAD_TOKEN to enable it.')
+
+    # constant time comparison, the token is not leaked through the response time
+    authorization = request.headers.get('authorization', '')
+    if not hmac.compare_digest(authorization.encode(), f'Bearer {reload_token}'.encode()):
+        raise HTTPException(status_code=401, detail='Invalid reload token.', headers={'WWW-Authenticate': 'Bearer'})
+
+    try:
+        loaded = registry.load()
+
+        return {
+            'version': loaded.version
         }
 
     except Exception as e:
-        raise CustomException(e, sys)
\ No newline at end of file
+        raise CustomException(e, sys)
@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from src.components.data_preprocessing import DataProcessing
+from src.utils.artifact_io import EXTENSIONS, RAW_SCHEMA, load_frame, processed_schema, save_frame
+from src.utils.splitting import hash_test_mask
+
+"""
+This script compares the artifact formats on the stage boundaries of the pipeline.
+It times the writes and reads each stage does and reports the size of the files on disk.
+
+    python benchmarks/artifact_formats.py --scale 20 --output format_benchmark.json
+"""
+
+def build_dataset(csv_path: str, scale: int) -> pd.DataFrame:
+    """
+    This function repeats the bundled dataset scale times with unique customer ids.
+    """
+    df = pd.read_csv(csv_path, dtype=RAW_SCHEMA)
+    copies = []
+    for i in range(scale):
+        copy = df.copy()
+        copy['customerID'] = copy['customerID'] + f'-{i}'
+        copies.append(copy)
+    return pd.concat(copies, ignore_index=True)
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def benchmark_format(fmt: str, raw_df: pd.DataFrame, train_processed: pd.DataFrame, test_processed: pd.DataFrame, directory: str) -> dict:
+    """
+    This function measures one format on the same data as the other formats.
+    """
+    paths = {name: os.path.join(directory, name + EXTENSIONS[fmt]) for name in ('raw', 'train', 'test', 'train_processed', 'test_processed')}
+    is_test = hash_test_mask(raw_df['customerID'], 0.2)
+    timings = {}
+
+    # data_ingestion writes the three raw datasets
+    _, timings['ingestion_write'] = timed(lambda: [
+        save_frame(raw_df, paths['raw'], RAW_SCHEMA),
+        save_frame(raw_df[~is_test], paths['train'], RAW_SCHEMA),
+        save_frame(raw_df[is_test], paths['test'], RAW_SCHEMA)
+    ])
+
+    # data_preprocessing reads the raw splits and writes the processed matrices
+    _, timings['preprocessing_read'] = timed(lambda: [load_frame(paths['train'], RAW_SCHEMA), load_frame(paths['test'], RAW_SCHEMA)])
+    _, timings['preprocessing_write'] = timed(lambda: [
+        save_frame(train_processed, paths['train_processed'], processed_schema(train_processed.columns)),
+        save_frame(test_processed, paths['test_processed'], processed_schema(test_processed.columns))
+    ])
+
+    # model_trainer and model_evaluation read the processed matrices
+    _, timings['training_read'] = timed(load_frame, paths['train_processed'], memory_map=True)
+    _, timings['evaluation_read'] = timed(load_frame, paths['test_processed'], memory_map=True)
+
+    return {
+        'format': fmt,
+        'seconds': {stage: round(seconds, 4) for stage, seconds in timings.items()},
+        'total_seconds': round(sum(timings.values()), 4),
+        'bytes': {name: os.path.getsize(path) for name, path in paths.items()}
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare the artifact formats used between pipeline stages.')
+    parser.add_argument('--csv', default='WA_Fn-UseC_-Telco-Customer-Churn.csv')
+    parser.add_argument('--scale', type=int, default=10, help='number of copies of the bundled dataset')
+    parser.add_argument('--formats', nargs='+', default=list(EXTENSIONS))
+    parser.add_argument('--output', help='optional path of a JSON report')
+    args = parser.parse_args()
+
+    raw_df = build_dataset(args.csv, args.scale)
+    is_test = hash_test_mask(raw_df['customerID'], 0.2)
+    train_processed, test_processed, _ = DataProcessing().process_data(raw_df[~is_test].copy(), raw_df[is_test].copy())
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for fmt in args.formats:
+            results.append(benchmark_format(fmt, raw_df, train_processed, test_processed, directory))
+
+    print(f'{len(raw_df)} rows')
+    print(f"{'format':<10}{'total s':>10}{'ingest w':>10}{'prep r':>10}{'prep w':>10}{'train r':>10}{'eval r':>10}{'MB':>10}")
+    for result in results:
+        seconds = result['seconds']
+        print(
+            f"{result['format']:<10}{result['total_seconds']:>10.3f}{seconds['ingestion_write']:>10.3f}{seconds['preprocessing_read']:>10.3f}"
+            f"{seconds['preprocessing_write']:>10.3f}{seconds['training_read']:>10.3f}{seconds['evaluation_read']:>10.3f}"
+            f"{sum(result['bytes'].values()) / 1e6:>10.1f}"
+        )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'rows': len(raw_df), 'results': results}, f, indent=2)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,220 @@
+import argparse
+import asyncio
+import json
+import os
+import pickle
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+import pandas as pd
+import psutil
+from imblearn.over_sampling import SMOTE
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+
+from src.components.data_preprocessing import DataProcessing
+from src.components.model_trainer import DEFAULT_PARAMS
+from src.utils.artifact_io import RAW_SCHEMA
+from src.utils.splitting import hash_test_mask
+
+"""
+This script measures the latency and throughput of the prediction API.
+It trains an inference pipeline from the bundled dataset into a temporary folder, then drives the
+endpoints in-process and over a local uvicorn server at several concurrency levels.
+
+    python benchmarks/serving_benchmark.py --concurrency 1 8 32 --output serving_benchmark.json
+"""
+
+def train_inference_pipeline(csv_path: str, directory: str) -> tuple:
+    """
+    This function trains the model the way the pipeline does, without MLflow, and saves the inference pipeline.
+    """
+    raw_df = pd.read_csv(csv_path, dtype=RAW_SCHEMA)
+    is_test = hash_test_mask(raw_df['customerID'], 0.2)
+    train_processed, _, preprocessor = DataProcessing().process_data(raw_df[~is_test].copy(), raw_df[is_test].copy())
+
+    X_train, y_train = SMOTE(random_state=42).fit_resample(train_processed.drop('Churn', axis=1), train_processed['Churn'])
+    model = LogisticRegression(**DEFAULT_PARAMS, random_state=42).fit(X_train, y_train)
+
+    path = os.path.join(directory, 'models', 'inference_pipeline.pkl')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        pickle.dump(Pipeline(preprocessor.steps + [('model', model)]), f)
+    return path, raw_df[is_test]
+
+def build_payloads(test_df: pd.DataFrame) -> list:
+    """
+    This function turns the raw testing rows into /predict request bodies.
+    """
+    df = test_df.drop(['customerID', 'Churn'], axis=1).copy()
+    df['SeniorCitizen'] = df['SeniorCitizen'].map({1: 'Yes', 0: 'No'})
+    df['TotalCharges'] = pd.to_numeric(df['TotalCharges'], errors='coerce').fillna(0.0)
+    return df.to_dict('records')
+
+def summarize(latencies: list, wall_time: float, rows_per_request: int) -> dict:
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        'requests': len(latencies),
+        'p50_ms': round(float(np.percentile(latencies_ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(latencies_ms, 95)), 3),
+        'p99_ms': round(float(np.percentile(latencies_ms, 99)), 3),
+        'max_ms': round(float(latencies_ms.max()), 3),
+        'requests_per_second': round(len(latencies) / wall_time, 1),
+        'rows_per_second': round(len(latencies) * rows_per_request / wall_time, 1)
+    }
+
+async def drive(client: httpx.AsyncClient, path: str, bodies: list, n_requests: int, concurrency: int) -> tuple:
+    """
+    This function sends n_requests POST requests from concurrency workers and returns the latencies and the wall time.
+    """
+    latencies = []
+    counter = iter(range(n_requests))
+
+    async def worker() -> None:
+        for i in counter:
+            start = time.perf_counter()
+            body = bodies[i % len(bodies)]
+            if isinstance(body, bytes):
+                response = await client.post(path, content=body, headers={'content-type': 'text/csv'})
+            else:
+                response = await client.post(path, json=body)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise RuntimeError(f'{path} returned {response.status_code}: {response.text[:200]}')
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - start
+
+async def run_scenarios(client: httpx.AsyncClient, mode: str, payloads: list, args) -> list:
+    """
+    This function runs every endpoint at every concurrency level against one client.
+    """
+    scenarios = [('/predict', payloads, 1, args.requests)]
+    if args.batch_size > 0:
+        batches = [payloads[i:i + args.batch_size] for i in range(0, len(payloads) - args.batch_size + 1, args.batch_size)] or [payloads]
+        scenarios.append(('/predict/batch', batches, args.batch_size, max(args.requests // args.batch_size, 20)))
+    if args.file_rows > 0:
+        # the whole upload is one CSV body, the response is read to the end so the streamed scoring is included
+        upload = pd.DataFrame(payloads[:args.file_rows]).to_csv(index=False).encode()
+        file_rows = min(args.file_rows, len(payloads))
+        scenarios.append(('/predict/batch/file', [upload], file_rows, max(args.requests // file_rows, 20)))
+
+    results = []
+    for path, bodies, rows_per_request, n_requests in scenarios:
+        # warming up the connections, the thread pool and the caches before measuring
+        await drive(client, path, bodies, min(n_requests, 50), max(args.concurrency))
+        for concurrency in args.concurrency:
+            latencies, wall_time = await drive(client, path, bodies, n_requests, concurrency)
+            result = dict(mode=mode, endpoint=path, concurrency=concurrency, **summarize(latencies, wall_time, rows_per_request))
+            results.append(result)
+            print(
+                f"{mode:<12}{path:<22}{concurrency:>6}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+                f"{result['p99_ms']:>10.2f}{result['requests_per_second']:>10.0f}{result['rows_per_second']:>12.0f}"
+            )
+    return results
+
+def process_memory(process: psutil.Process) -> dict:
+    """
+    This function returns the resident memory in MB of a process and of each of its children.
+    """
+    processes = [process] + process.children(recursive=True)
+    return {str(p.pid): round(p.memory_info().rss / 1e6, 1) for p in processes if p.is_running()}
+
+async def benchmark_in_process(payloads: list, args) -> tuple:
+    # imported here so the app picks up INFERENCE_PIPELINE_PATH from the environment
+    from app import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://benchmark') as client:
+            results = await run_scenarios(client, 'in-process', payloads, args)
+    return results, process_memory(psutil.Process())
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+async def benchmark_uvicorn(payloads: list, args) -> tuple:
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app:app', '--host', '127.0.0.1', '--port', str(port), '--workers', str(args.workers), '--log-level', 'warning'],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=os.environ.copy()
+    )
+    try:
+        limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+        async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}', limits=limits, timeout=60) as client:
+            # waiting for every worker to load the model
+            deadline = time.monotonic() + 120
+            while True:
+                try:
+                    if (await client.post('/predict', json=payloads[0])).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if server.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError('The uvicorn server did not start.')
+                await asyncio.sleep(0.2)
+
+            results = await run_scenarios(client, f'uvicorn-{args.workers}w', payloads, args)
+            memory = process_memory(psutil.Process(server.pid))
+        return results, memory
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure the latency and throughput of the prediction API.')
+    parser.add_argument('--csv', default='WA_Fn-UseC_-Telco-Customer-Churn.csv')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per concurrency level for /predict')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--batch-size', type=int, default=100, help='records per /predict/batch request, 0 to skip it')
+    parser.add_argument('--file-rows', type=int, default=1000, help='rows per /predict/batch/file upload, 0 to skip it')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn worker processes')
+    parser.add_argument('--modes', nargs='+', default=['in-process', 'uvicorn'], choices=['in-process', 'uvicorn'])
+    parser.add_argument('--output', help='optional path of a JSON report')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        pipeline_path, test_df = train_inference_pipeline(args.csv, directory)
+        os.environ['INFERENCE_PIPELINE_PATH'] = pipeline_path
+        payloads = build_payloads(test_df)
+
+        print(f"{'mode':<12}{'endpoint':<22}{'conc':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'rows/s':>12}")
+        results, memory = [], {}
+        if 'in-process' in args.modes:
+            mode_results, memory['in-process'] = asyncio.run(benchmark_in_process(payloads, args))
+            results.extend(mode_results)
+        if 'uvicorn' in args.modes:
+            mode_results, memory[f'uvicorn-{args.workers}w'] = asyncio.run(benchmark_uvicorn(payloads, args))
+            results.extend(mode_results)
+
+    for mode, processes in memory.items():
+        print(f'{mode} RSS MB per process: {processes}')
+
+    if args.output:
+        report = {
+            'config': {
+                'requests': args.requests,
+                'concurrency': args.concurrency,
+                'batch_size': args.batch_size,
+                'file_rows': args.file_rows,
+                'workers': args.workers,
+                'python': sys.version.split()[0],
+                'cpu_count': os.cpu_count()
+            },
+            'results': results,
+            'memory_mb': memory
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    sys.exit(main())
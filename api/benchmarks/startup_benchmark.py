@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import psutil
+
+from serving_benchmark import build_payloads, free_port, train_inference_pipeline
+
+"""
+This script measures how fast the prediction API starts and how much memory its workers use.
+It times the import of the serving modules in a fresh interpreter, then starts uvicorn and gunicorn
+with and without preloading the model, and reports the time to the first prediction together with
+the RSS, USS and PSS of every process. PSS splits the shared pages between the processes, so its
+total is the real footprint of the server.
+
+    python benchmarks/startup_benchmark.py --workers 4 --output startup_benchmark.json
+"""
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ['numpy', 'pandas', 'scipy', 'sklearn', 'pyarrow', 'imblearn', 'mlflow', 'dvc', 'pymongo']
+
+IMPORT_PROBE = (
+    'import json, sys, time\n'
+    'start = time.perf_counter()\n'
+    'import {module}\n'
+    'seconds = time.perf_counter() - start\n'
+    'print(json.dumps({{"seconds": seconds, "modules": [m for m in {heavy!r} if m in sys.modules]}}))'
+)
+
+def measure_import(module: str, repeats: int) -> dict:
+    """
+    This function imports a module in fresh interpreters and returns the median time and the heavy modules it loaded.
+    """
+    runs = []
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, '-c', IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=API_DIR, env=os.environ.copy(), capture_output=True, text=True, check=True
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        'module': module,
+        'median_seconds': round(statistics.median(run['seconds'] for run in runs), 4),
+        'heavy_modules_loaded': runs[-1]['modules']
+    }
+
+def process_memory(process: psutil.Process) -> list:
+    """
+    This function returns the RSS, USS and PSS in MB of a server process and of its workers.
+    """
+    rows = []
+    for p in [process] + process.children(recursive=True):
+        info = p.memory_full_info()
+        rows.append({
+            'pid': p.pid,
+            'rss_mb': round(info.rss / 1e6, 1),
+            'uss_mb': round(info.uss / 1e6, 1),
+            # only reported on Linux
+            'pss_mb': round(getattr(info, 'pss', 0) / 1e6, 1)
+        })
+    return rows
+
+def measure_server(name: str, command: list, env: dict, payload: dict, workers: int, warmup: int) -> dict:
+    """
+    This function starts a server, waits for its first prediction and measures the memory once every worker has served requests.
+    """
+    start = time.perf_counter()
+    server = subprocess.Popen(command, cwd=API_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        port = env['PORT']
+        with httpx.Client(base_url=f'http://127.0.0.1:{port}', timeout=60) as client:
+            while True:
+                try:
+                    if client.post('/predict', json=payload).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if server.poll() is not None or time.perf_counter() - start > 180:
+                    raise RuntimeError(f'{name} did not start.')
+                time.sleep(0.05)
+            first_prediction = time.perf_counter() - start
+
+            # waiting for the other workers, then spreading requests over all of them
+            process = psutil.Process(server.pid)
+            deadline = time.perf_counter() + 120
+            while len(process.children(recursive=True)) < workers and time.perf_counter() < deadline:
+                time.sleep(0.1)
+            for _ in range(warmup):
+                client.post('/predict', json=payload)
+
+        memory = process_memory(process)
+        result = {
+            'server': name,
+            'seconds_to_first_prediction': round(first_prediction, 3),
+            'processes': memory,
+            'total_pss_mb': round(sum(row['pss_mb'] for row in memory), 1),
+            'total_rss_mb': round(sum(row['rss_mb'] for row in memory), 1)
+        }
+        print(f"{name:<24}{result['seconds_to_first_prediction']:>10.2f}{len(memory):>8}{result['total_rss_mb']:>12.0f}{result['total_pss_mb']:>12.0f}")
+        return result
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure the start-up time and the memory of the prediction API.')
+    parser.add_argument('--csv', default='WA_Fn-UseC_-Telco-Customer-Churn.csv')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--repeats', type=int, default=5, help='fresh interpreters per import measurement')
+    parser.add_argument('--warmup', type=int, default=200, help='requests sent before measuring the memory')
+    parser.add_argument('--output', help='optional path of a JSON report')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        pipeline_path, test_df = train_inference_pipeline(args.csv, directory)
+        payload = build_payloads(test_df)[0]
+        base_env = dict(os.environ, INFERENCE_PIPELINE_PATH=pipeline_path, LOG_TO_FILE='0')
+
+        imports = [measure_import(module, args.repeats) for module in ('app', 'serve')]
+        for result in imports:
+            print(f"import {result['module']:<8}{result['median_seconds']:>8.3f}s  heavy modules: {result['heavy_modules_loaded']}")
+
+        print(f"{'server':<24}{'first s':>10}{'procs':>8}{'RSS MB':>12}{'PSS MB':>12}")
+        servers = []
+        port = free_port()
+        servers.append(measure_server(
+            'uvicorn',
+            [sys.executable, '-m', 'uvicorn', 'app:app', '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'],
+            dict(base_env, PORT=str(port)), payload, 0, args.warmup
+        ))
+        for preload in ('0', '1'):
+            port = free_port()
+            env = dict(base_env, PORT=str(port), WEB_CONCURRENCY=str(args.workers), SERVING_PRELOAD=preload)
+            servers.append(measure_server(
+                f'gunicorn-{args.workers}w-' + ('preload' if preload == '1' else 'no-preload'),
+                [sys.executable, '-m', 'gunicorn', 'serve:app', '--bind', f'127.0.0.1:{port}'],
+                env, payload, args.workers, args.warmup
+            ))
+
+    if args.output:
+        report = {
+            'config': {'workers': args.workers, 'repeats': args.repeats, 'python': sys.version.split()[0], 'cpu_count': os.cpu_count()},
+            'imports': imports,
+            'servers': servers
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,7 +10,12 @@ print("=" * 80)
 print("PREPROCESSOR CONFIGURATION")
 print("=" * 80)
 
-for name, transformer, columns in preprocessor.transformers_:
+# the preprocessor is the cleaning step followed by the ColumnTransformer
+for step_name, step in preprocessor.steps[:-1]:
+    print(f"\nCleaning step: {step_name}")
+    print(f"Transformer type: {type(step)}")
+
+for name, transformer, columns in preprocessor[-1].transformers_:
     print(f"\nTransformer: {name}")
     print(f"Columns: {columns}")
     print(f"Transformer type: {type(transformer)}")
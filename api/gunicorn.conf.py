@@ -0,0 +1,20 @@
+import os
+
+"""
+These are the gunicorn settings of the serving image, gunicorn reads this file from the working directory.
+"""
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+worker_class = 'uvicorn_worker.UvicornWorker'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+
+# importing the app and loading the model in the master, the workers inherit them copy-on-write
+preload_app = os.getenv('SERVING_PRELOAD', '1') == '1'
+
+def when_ready(server) -> None:
+    if preload_app:
+        # the app module is already imported by the preload, this only loads the model
+        from serve import preload
+        preload()
+        server.log.info('Model preloaded in the master process.')
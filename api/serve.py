@@ -0,0 +1,21 @@
+import gc
+
+# app is the ASGI application gunicorn serves
+from app import app, registry
+
+"""
+This is the serving-only entry point. It only needs requirements-serving.txt, and the settings in
+gunicorn.conf.py load the model once in the gunicorn master so that the forked workers share it.
+
+    gunicorn serve:app
+"""
+
+def preload() -> None:
+    """
+    This function loads the model in the current process before the workers are forked.
+    """
+    registry.load()
+
+    # everything allocated so far is moved out of the collector's reach, otherwise the first
+    # collection in a worker writes to every shared object and copies the pages it touches
+    gc.freeze()
@@ -1,26 +1,67 @@
 import pandas as pd
+import numpy as np
 import os
 import sys
+import json
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import islice
+from bson import ObjectId
 from sklearn.model_selection import train_test_split
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 from src.logger import logging
 from src.exception import CustomException
 from src.configurations.mongodb_connection import MongoDBConnection
+from src.utils.splitting import hash_test_mask
+from src.utils.artifact_io import RAW_SCHEMA, FrameWriter, artifact_path, iter_frames, save_frame
+from src.utils.data_pusher import UPDATED_AT_FIELD
+from src.utils.profiling import StageProfiler
 
 @dataclass
 class DataIngestionConfig:
     """
     This is a special class which is used for the paths of datasets.
     """
-    raw_data_path: str = os.path.join('artifacts', 'raw', 'raw.csv')
-    train_data_path: str = os.path.join('artifacts', 'raw', 'train.csv')
-    test_data_path: str = os.path.join('artifacts', 'raw', 'test.csv')
+    raw_data_path: str = artifact_path(os.path.join('artifacts', 'raw'), 'raw')
+    train_data_path: str = artifact_path(os.path.join('artifacts', 'raw'), 'train')
+    test_data_path: str = artifact_path(os.path.join('artifacts', 'raw'), 'test')
+    collection_name: str = 'churn-prediction'
+    test_size: float = 0.2
+    random_state: int = 42
+    # hash assigns each customer from its id in any chunk and any order, random is the previous shuffled split
+    split_mode: str = field(default_factory=lambda: os.getenv('INGESTION_SPLIT_MODE', 'hash'))
+    # full loads everything at once, streaming writes chunk by chunk, incremental only fetches the delta,
+    # sharded reads _id ranges of the collection concurrently
+    mode: str = field(default_factory=lambda: os.getenv('INGESTION_MODE', 'full'))
+    batch_size: int = field(default_factory=lambda: int(os.getenv('INGESTION_BATCH_SIZE', '10000')))
+    # local store and watermark used by the incremental mode, kept outside the DVC managed raw folder
+    store_path: str = os.path.join('artifacts', 'store', 'customers.parquet')
+    watermark_path: str = os.path.join('artifacts', 'store', 'watermark.json')
+    # updated_at, stamped by data_pusher on every upsert, sees new and refreshed documents, _id only sees new ones
+    watermark_field: str = field(default_factory=lambda: os.getenv('INGESTION_WATERMARK_FIELD', 'updated_at'))
+    # seconds a date watermark is moved back, a document stamped just before the last read may only have been
+    # committed after it, the documents fetched twice replace themselves in the store
+    watermark_lag_seconds: float = field(default_factory=lambda: float(os.getenv('INGESTION_WATERMARK_LAG', '60')))
+    id_column: str = 'customerID'
+    # the sharded mode writes one part file per _id range here before merging them
+    parts_dir: str = os.path.join('artifacts', 'parts')
+    n_shards: int = field(default_factory=lambda: int(os.getenv('INGESTION_SHARDS', '8')))
+    n_workers: int = field(default_factory=lambda: int(os.getenv('INGESTION_WORKERS', '4')))
 
 class DataIngestion:
     def __init__(self) -> None:
         self.ingestion_config = DataIngestionConfig()
 
+    def projection(self, keep_field: Optional[str] = None) -> dict:
+        """
+        This function returns the projection dropping the MongoDB bookkeeping fields, apart from keep_field.
+        """
+        return {name: 0 for name in ('_id', UPDATED_AT_FIELD) if name != keep_field}
+
     def load_data(self) -> pd.DataFrame:
         """
         This function fetches the dataset from MongoDB Atlas and converts it into a pandas dataframe.
@@ -29,21 +70,31 @@ class DataIngestion:
             logging.info('Data Ingestion Started.')
             # Fetching the dataset
             mongodb = MongoDBConnection()
-            collection = mongodb.database['churn-prediction']
-            data = list(collection.find({}))
+            collection = mongodb.database[self.ingestion_config.collection_name]
+
+            # the unnecessary _id and updated_at columns are dropped by MongoDB before it is sent
+            data = list(collection.find({}, self.projection(), batch_size=mongodb.mongodb_config.batch_size))
 
             # converting the dataset into a pandas DataFrame
             df = pd.DataFrame(data)
-
-            # dropping the unnecessary _id column from MongoDB
-            df.drop('_id', inplace=True, axis=1)
             logging.info('Dataset Fetched from MongoDB Successfully.')
             
             return df
         except Exception as e:
             raise CustomException(e, sys)
 
-    def save_data(self) -> None:
+    def split_data(self, df) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        This function splits the dataset into training and testing sets.
+        """
+        if self.ingestion_config.split_mode == 'random':
+            return train_test_split(df, test_size=self.ingestion_config.test_size, random_state=self.ingestion_config.random_state)
+
+        # two boolean selections in the original order, no shuffled copy of the whole dataset
+        is_test = hash_test_mask(df[self.ingestion_config.id_column], self.ingestion_config.test_size)
+        return df[~is_test], df[is_test]
+
+    def save_data(self) -> int:
         """
         This function splits the dataset into training and testing sets, and then saves the datasets into the artifacts/raw folder. 
         """
@@ -55,17 +106,282 @@ class DataIngestion:
 
             # saving the raw dataset
             logging.info('Saving the raw dataset.')
-            df.to_csv(self.ingestion_config.raw_data_path, index=False, header=True)
+            save_frame(df, self.ingestion_config.raw_data_path, RAW_SCHEMA)
 
             # splitting the dataset into training and testing sets
-            train_df, test_df = train_test_split(df, test_size=0.2, random_state=42)
+            train_df, test_df = self.split_data(df)
 
             # saving the training and testing datasets
             logging.info('Saving the training dataset.')
-            train_df.to_csv(self.ingestion_config.train_data_path, index=False, header=True)
+            save_frame(train_df, self.ingestion_config.train_data_path, RAW_SCHEMA)
             logging.info('Saving the testing dataset.')
-            test_df.to_csv(self.ingestion_config.test_data_path, index=False, header=True)
+            save_frame(test_df, self.ingestion_config.test_data_path, RAW_SCHEMA)
+            logging.info('Data Ingestion Completed.')
+            return len(df)
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def load_data_chunks(self, query: Optional[dict] = None, keep_field: Optional[str] = None, sort_field: Optional[str] = None) -> Iterator[pd.DataFrame]:
+        """
+        This function streams the dataset from MongoDB Atlas in DataFrames of at most batch_size rows.
+        """
+        try:
+            logging.info('Streaming Data Ingestion Started.')
+            mongodb = MongoDBConnection()
+            collection = mongodb.database[self.ingestion_config.collection_name]
+
+            batch_size = self.ingestion_config.batch_size
+            cursor = collection.find(query or {}, self.projection(keep_field), batch_size=mongodb.mongodb_config.batch_size)
+            if sort_field is not None:
+                cursor = cursor.sort(sort_field, 1)
+
+            with cursor:
+                while True:
+                    documents = list(islice(cursor, batch_size))
+                    if not documents:
+                        break
+                    # converting the batch into columns straight away so the dicts can be released
+                    yield pd.DataFrame.from_records(documents)
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def write_datasets(self, chunks: Iterable[pd.DataFrame]) -> int:
+        """
+        This function writes the raw, training and testing datasets from a stream of chunks and returns the row count.
+        """
+        os.makedirs(os.path.dirname(self.ingestion_config.raw_data_path), exist_ok=True)
+
+        # in random mode each row goes to the testing set with probability test_size
+        rng = np.random.default_rng(self.ingestion_config.random_state)
+        rows = 0
+
+        with FrameWriter(self.ingestion_config.raw_data_path, RAW_SCHEMA) as raw_writer, \
+             FrameWriter(self.ingestion_config.train_data_path, RAW_SCHEMA) as train_writer, \
+             FrameWriter(self.ingestion_config.test_data_path, RAW_SCHEMA) as test_writer:
+
+            for chunk in chunks:
+                if self.ingestion_config.split_mode == 'random':
+                    is_test = rng.random(len(chunk)) < self.ingestion_config.test_size
+                else:
+                    is_test = hash_test_mask(chunk[self.ingestion_config.id_column], self.ingestion_config.test_size)
+
+                # the writers keep the column order of the first chunk for every file
+                raw_writer.write(chunk)
+                train_writer.write(chunk[~is_test])
+                test_writer.write(chunk[is_test])
+
+                rows += len(chunk)
+                logging.info(f'{rows} rows written.')
+
+        return rows
+
+    def save_data_streaming(self) -> int:
+        """
+        This function writes the raw, training and testing datasets while the collection is being streamed.
+        """
+        try:
+            rows = self.write_datasets(self.load_data_chunks())
+            logging.info('Data Ingestion Completed.')
+            return rows
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def shard_queries(self) -> List[dict]:
+        """
+        This function splits the collection into n_shards contiguous _id ranges of about the same size.
+        """
+        try:
+            mongodb = MongoDBConnection()
+            collection = mongodb.database[self.ingestion_config.collection_name]
+
+            total = collection.count_documents({})
+            n_shards = max(min(self.ingestion_config.n_shards, total), 1)
+
+            # the boundaries are read from the _id index, without fetching the documents
+            boundaries = []
+            for shard in range(1, n_shards):
+                boundary = collection.find_one({}, {'_id': 1}, sort=[('_id', 1)], skip=shard * total // n_shards)
+                if boundary is not None and (not boundaries or boundary['_id'] != boundaries[-1]):
+                    boundaries.append(boundary['_id'])
+
+            lows = [None] + boundaries
+            highs = boundaries + [None]
+            queries = []
+            for low, high in zip(lows, highs):
+                bounds = {}
+                if low is not None:
+                    bounds['$gte'] = low
+                if high is not None:
+                    bounds['$lt'] = high
+                queries.append({'_id': bounds} if bounds else {})
+            return queries
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def ingest_shard(self, index: int, query: dict) -> dict:
+        """
+        This function reads one _id range into its own part file and returns what it read.
+        """
+        try:
+            path = artifact_path(self.ingestion_config.parts_dir, f'part-{index:04d}')
+            rows, size = 0, 0
+            start = time.perf_counter()
+
+            with FrameWriter(path, RAW_SCHEMA) as writer:
+                for chunk in self.load_data_chunks(query):
+                    writer.write(chunk)
+                    rows += len(chunk)
+                    size += int(chunk.memory_usage(deep=True).sum())
+
+            elapsed = time.perf_counter() - start
+            logging.info(f'Shard {index}: {rows} documents in {elapsed:.2f}s.')
+            return {'path': path if rows else None, 'rows': rows, 'bytes': size}
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def save_data_sharded(self) -> dict:
+        """
+        This function reads the _id ranges of the collection concurrently and merges the part files into the datasets.
+        """
+        try:
+            config = self.ingestion_config
+            shutil.rmtree(config.parts_dir, ignore_errors=True)
+            os.makedirs(config.parts_dir, exist_ok=True)
+
+            queries = self.shard_queries()
+            logging.info(f'Reading {len(queries)} shards with {config.n_workers} workers.')
+
+            # the workers share the pooled client, pymongo releases the GIL while waiting on the network
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=config.n_workers) as executor:
+                shards = list(executor.map(self.ingest_shard, range(len(queries)), queries))
+            read_time = time.perf_counter() - start
+
+            rows = sum(shard['rows'] for shard in shards)
+            size = sum(shard['bytes'] for shard in shards)
+            report = {
+                'documents': rows,
+                'shards': len(shards),
+                'workers': config.n_workers,
+                'read_seconds': read_time,
+                'docs_per_second': rows / read_time if read_time > 0 else 0.0,
+                'mb_per_second': size / 1e6 / read_time if read_time > 0 else 0.0
+            }
+            logging.info(f'Read {rows} documents at {report["docs_per_second"]:.0f} docs/sec, {report["mb_per_second"]:.1f} MB/sec.')
+
+            # merging in shard order, which is _id order
+            parts = [shard['path'] for shard in shards if shard['path'] is not None]
+            chunks = (chunk for path in parts for chunk in iter_frames(path, config.batch_size, RAW_SCHEMA))
+            self.write_datasets(chunks)
+            shutil.rmtree(config.parts_dir, ignore_errors=True)
+
+            logging.info('Data Ingestion Completed.')
+            return report
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def read_watermark(self) -> Optional[dict]:
+        """
+        This function returns the query filter for the documents added or changed since the last run.
+        """
+        if not os.path.exists(self.ingestion_config.watermark_path):
+            return None
+
+        with open(self.ingestion_config.watermark_path) as f:
+            watermark = json.load(f)
+
+        # for example an _id watermark saved before updated_at became the default, the collection is
+        # fetched once in full and merged into the store, which is safe since a customer replaces itself
+        if watermark['field'] != self.ingestion_config.watermark_field:
+            logging.warning(f"The saved watermark is on {watermark['field']}, not {self.ingestion_config.watermark_field}, fetching the whole collection.")
+            return None
+
+        value = watermark['value']
+        if watermark['type'] == 'objectid':
+            value = ObjectId(value)
+        elif watermark['type'] == 'datetime':
+            value = datetime.fromisoformat(value) - timedelta(seconds=self.ingestion_config.watermark_lag_seconds)
+
+        return {watermark['field']: {'$gt': value}}
+
+    def write_watermark(self, value) -> None:
+        """
+        This function saves the highest watermark value seen, replacing the previous file atomically.
+        """
+        if isinstance(value, ObjectId):
+            watermark = {'type': 'objectid', 'value': str(value)}
+        elif isinstance(value, datetime):
+            watermark = {'type': 'datetime', 'value': value.isoformat()}
+        else:
+            watermark = {'type': 'raw', 'value': value.item() if hasattr(value, 'item') else value}
+        watermark['field'] = self.ingestion_config.watermark_field
+
+        temp_path = self.ingestion_config.watermark_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(watermark, f)
+        os.replace(temp_path, self.ingestion_config.watermark_path)
+
+    def save_data_incremental(self) -> int:
+        """
+        This function fetches only the new or changed documents, merges them into the local store and rewrites the datasets.
+        """
+        try:
+            config = self.ingestion_config
+            os.makedirs(os.path.dirname(config.store_path), exist_ok=True)
+            os.makedirs(os.path.dirname(config.raw_data_path), exist_ok=True)
+
+            query = self.read_watermark()
+            logging.info(f'Fetching the documents matching {query}.' if query else 'No watermark found, fetching the whole collection.')
+
+            # the bookkeeping fields are only fetched when they are the watermark field
+            delta = list(self.load_data_chunks(query, config.watermark_field, config.watermark_field))
+
+            if delta:
+                delta_df = pd.concat(delta, ignore_index=True)
+                # documents written before the updated_at stamp existed have no value to move the watermark to,
+                # the watermark is then kept and the next run fetches them again
+                if config.watermark_field in delta_df.columns and delta_df[config.watermark_field].notna().any():
+                    watermark = delta_df[config.watermark_field].max()
+                else:
+                    logging.warning(f'None of the fetched documents has {config.watermark_field}, the watermark is not moved. Load the collection with data_pusher to stamp them.')
+                    watermark = None
+                if config.watermark_field == '_id':
+                    delta_df = delta_df.drop('_id', axis=1)
+                logging.info(f'{len(delta_df)} new or changed documents fetched.')
+
+                # merging the delta into the store, a changed customer replaces its previous version
+                if os.path.exists(config.store_path):
+                    store_df = pd.concat([pd.read_parquet(config.store_path), delta_df], ignore_index=True)
+                else:
+                    store_df = delta_df
+                store_df = store_df.drop_duplicates(subset=config.id_column, keep='last')
+                store_df.to_parquet(config.store_path, index=False)
+            else:
+                # DVC clears artifacts/raw before the stage runs, so the datasets are rewritten from the store
+                logging.info('No new or changed documents since the last run.')
+                watermark = None
+                store_df = pd.read_parquet(config.store_path)
+
+            # a customer keeps its set between runs because the split only depends on its id
+            dataset_df = store_df.drop(columns=[config.watermark_field], errors='ignore')
+            is_test = hash_test_mask(dataset_df[config.id_column], config.test_size)
+
+            logging.info('Saving the raw, training and testing datasets.')
+            save_frame(dataset_df, config.raw_data_path, RAW_SCHEMA)
+            save_frame(dataset_df[~is_test], config.train_data_path, RAW_SCHEMA)
+            save_frame(dataset_df[is_test], config.test_data_path, RAW_SCHEMA)
+
+            # only moving the watermark once every artifact has been written
+            if watermark is not None:
+                self.write_watermark(watermark)
             logging.info('Data Ingestion Completed.')
+            return len(dataset_df)
 
         except Exception as e:
             raise CustomException(e, sys)
@@ -74,7 +390,15 @@ class DataIngestion:
             """
             This function will run the entire data ingestion script.
             """
-            self.save_data()
+            with StageProfiler('data_ingestion') as profiler:
+                if self.ingestion_config.mode == 'incremental':
+                    profiler.rows = self.save_data_incremental()
+                elif self.ingestion_config.mode == 'streaming':
+                    profiler.rows = self.save_data_streaming()
+                elif self.ingestion_config.mode == 'sharded':
+                    profiler.rows = self.save_data_sharded()['documents']
+                else:
+                    profiler.rows = self.save_data()
 
 if __name__ == '__main__':
     data_ingestor = DataIngestion()
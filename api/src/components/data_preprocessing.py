@@ -8,21 +8,31 @@ from sklearn.preprocessing import StandardScaler, OneHotEncoder, FunctionTransfo
 from sklearn.compose import ColumnTransformer
 from sklearn.impute import SimpleImputer
 from sklearn.pipeline import Pipeline
-from dataclasses import dataclass
-from typing import Tuple
+from sklearn.base import clone
+from dataclasses import dataclass, field
+from typing import Dict, Tuple
 
 
 from src.logger import logging
 from src.exception import CustomException
+from src.utils.transformers import CategoryNormalizer
+from src.utils.data_quality import outlier_report, streaming_outlier_report
+from src.utils.profiling import profiled
+from src.utils.artifact_io import RAW_SCHEMA, FrameWriter, artifact_path, iter_frames, load_frame, processed_schema, save_frame
 
 @dataclass
 class DataProcessingConfig:
     """
     This is a special class which is used for the paths of datasets and preprocessor.
     """
-    train_processed_data_path: str = os.path.join('artifacts', 'processed', 'train.csv')
-    test_processed_data_path: str = os.path.join('artifacts', 'processed', 'test.csv')
+    train_processed_data_path: str = artifact_path(os.path.join('artifacts', 'processed'), 'train')
+    test_processed_data_path: str = artifact_path(os.path.join('artifacts', 'processed'), 'test')
     processor_data_path = os.path.join('artifacts', 'preprocessor.pkl')
+    # batch fits the preprocessor on the whole training set, streaming fits and transforms chunk by chunk
+    mode: str = field(default_factory=lambda: os.getenv('PREPROCESSING_MODE', 'batch'))
+    chunk_size: int = field(default_factory=lambda: int(os.getenv('PREPROCESSING_CHUNK_SIZE', '10000')))
+    # logs the z-score and IQR outlier rates of the scaled columns of the training dataset
+    data_quality_report: bool = field(default_factory=lambda: os.getenv('DATA_QUALITY_REPORT', '0') == '1')
 
 class DataProcessing:
     def __init__(self) -> None:
@@ -35,8 +45,8 @@ class DataProcessing:
         try:
             logging.info('Data Processing Started.')
             logging.info('Loading the raw datasets.')
-            train_df = pd.read_csv(train_path)
-            test_df = pd.read_csv(test_path)
+            train_df = load_frame(train_path, RAW_SCHEMA)
+            test_df = load_frame(test_path, RAW_SCHEMA)
 
             logging.info('Raw datasets loaded successfully.')
 
@@ -48,82 +58,106 @@ class DataProcessing:
             raise CustomException(e, sys)
         
 
-    def process_data(self, train_df, test_df)  -> Tuple[pd.DataFrame, pd.DataFrame, ColumnTransformer]:
+    def separate_target(self, df) -> Tuple[pd.DataFrame, pd.Series]:
+        """
+        This function drops the customerID column and splits the features from the mapped target.
+        """
+        X = df.drop(['customerID', 'Churn'], axis=1)
+        y = df['Churn'].map({'Yes': 1, 'No': 0})
+        return X, y
+
+    def build_preprocessor(self, X) -> Pipeline:
+        """
+        This function builds the unfitted preprocessor for the feature columns of X.
+        """
+        # separating numeric, categorical features, TotalCharges is still a string until it is cleaned
+        log_feature = ['TotalCharges']
+        numeric_features = X.select_dtypes(include='number').columns.difference(['SeniorCitizen', 'TotalCharges']).tolist()
+        categorical_features = X.select_dtypes(exclude='number').columns.difference(log_feature).tolist()
+
+        # skewed transformation pipeline
+        log_pipeline = Pipeline([
+            ('imputer', SimpleImputer(strategy='constant', fill_value=0.0)),
+            ('log_transform', FunctionTransformer(np.log1p, feature_names_out='one-to-one')),
+            ('scaler', StandardScaler())
+        ])
+
+        # numeric transformation pipeline
+        numeric_pipeline = Pipeline([
+            ('scaler', StandardScaler())
+        ])
+
+        # categorical transformation pipeline
+        categorical_pipeline = Pipeline([
+            ('encoder', OneHotEncoder(handle_unknown='ignore'))
+        ])
+
+        # column transformations
+        column_transformer = ColumnTransformer([
+            ('log', log_pipeline, log_feature),
+            ('numeric', numeric_pipeline, numeric_features),
+            ('categorical', categorical_pipeline, categorical_features)
+        ])
+
+        # full pipeline, the cleaning step is saved with the preprocessor so the API reuses it
+        preprocessor = Pipeline([
+            ('normalizer', CategoryNormalizer(numeric_columns=log_feature, binary_columns=['SeniorCitizen'])),
+            ('columns', column_transformer)
+        ])
+
+        return preprocessor
+
+    def scaled_columns(self, preprocessor) -> list:
+        """
+        This function returns the raw columns that go through a StandardScaler in the preprocessor.
+        """
+        columns = []
+        for _, pipeline, pipeline_columns in preprocessor.named_steps['columns'].transformers:
+            if isinstance(pipeline, Pipeline) and isinstance(pipeline[-1], StandardScaler):
+                columns.extend(pipeline_columns)
+        return columns
+
+    def encoded_columns(self, preprocessor) -> list:
+        """
+        This function returns the raw columns that go through a OneHotEncoder in the preprocessor.
+        """
+        columns = []
+        for _, pipeline, pipeline_columns in preprocessor.named_steps['columns'].transformers:
+            if isinstance(pipeline, Pipeline) and isinstance(pipeline[-1], OneHotEncoder):
+                columns.extend(pipeline_columns)
+        return columns
+
+    def log_outlier_report(self, report) -> None:
+        """
+        This function logs the outlier rates of every column of the report.
+        """
+        for column, row in report.iterrows():
+            logging.info(f'Outliers in {column}: z-score {int(row.z_outliers)} ({row.z_rate:.2%}), IQR {int(row.iqr_outliers)} ({row.iqr_rate:.2%}).')
+
+    @profiled('data_processing', rows=lambda result: len(result[0]) + len(result[1]))
+    def process_data(self, train_df, test_df)  -> Tuple[pd.DataFrame, pd.DataFrame, Pipeline]:
         """
         This function processes the raw training and testing datasets.
         """
         try:
 
             logging.info('Processing the data...')
-            # converting the TotalCharges feature into numeric
-            train_df['TotalCharges'] = pd.to_numeric(train_df['TotalCharges'], errors='coerce')
-            test_df['TotalCharges'] = pd.to_numeric(test_df['TotalCharges'], errors='coerce')
-
-            # dropping the customerID column
-            train_df.drop('customerID', axis=1, inplace=True)
-            test_df.drop('customerID', axis=1, inplace=True)
-
-            # separating numeric, categorical, target features
-            log_feature = ['TotalCharges']
-            numeric_features = train_df.select_dtypes(include=['int64', 'float64']).columns.difference(['SeniorCitizen', 'TotalCharges']).tolist()
-            categorical_features = train_df.select_dtypes(include='object').columns.difference(['Churn']).tolist()
-
-            # mapping the target feature Yes:1, No:0
-            train_df['Churn'] = train_df['Churn'].map({'Yes': 1, 'No': 0})
-            test_df['Churn'] = test_df['Churn'].map({'Yes': 1, 'No': 0})
-
-            # replacing the No internet service and No phone service with No    
-            for feature in categorical_features:
-                if 'No internet service' in train_df[feature].unique():
-                    train_df[feature] = train_df[feature].replace({
-                        'No internet service': 'No'
-                    })
-                    test_df[feature] = test_df[feature].replace({
-                        'No internet service': 'No'
-                    })
-                elif 'No phone service' in train_df[feature].unique():
-                    train_df[feature] = train_df[feature].replace({
-                        'No phone service': 'No'
-                    })
-                    test_df[feature] = test_df[feature].replace({
-                        'No phone service': 'No'
-                    })
-
-            # skewed transformation pipeline
-            log_pipeline = Pipeline([
-                ('imputer', SimpleImputer(strategy='constant', fill_value=0.0)),
-                ('log_transform', FunctionTransformer(np.log1p, feature_names_out='one-to-one')),
-                ('scaler', StandardScaler())
-            ])
-
-            # numeric transformation pipeline
-            numeric_pipeline = Pipeline([
-                ('scaler', StandardScaler())
-            ])
-
-            # categorical transformation pipeline
-            categorical_pipeline = Pipeline([
-                ('encoder', OneHotEncoder(handle_unknown='ignore'))
-            ])
-
-            # full pipeline
-            preprocessor = ColumnTransformer([
-                ('log', log_pipeline, log_feature),
-                ('numeric', numeric_pipeline, numeric_features),
-                ('categorical', categorical_pipeline, categorical_features)
-            ])
-
-            # separating X and y features
-            X_train = train_df.drop('Churn', axis=1)
-            X_test = test_df.drop('Churn', axis=1)
-
-            y_train = train_df['Churn']
-            y_test = test_df['Churn']
+
+            # separating X and y features, and mapping the target feature Yes:1, No:0
+            X_train, y_train = self.separate_target(train_df)
+            X_test, y_test = self.separate_target(test_df)
+
+            preprocessor = self.build_preprocessor(X_train)
 
             # fitting the pipeline
             X_train_processed = preprocessor.fit_transform(X_train)
             X_test_processed = preprocessor.transform(X_test)
 
+            if self.processor_config.data_quality_report:
+                # checked on the cleaned values, TotalCharges is only numeric after the cleaning step
+                X_train_clean = preprocessor.named_steps['normalizer'].transform(X_train)
+                self.log_outlier_report(outlier_report(X_train_clean, self.scaled_columns(preprocessor)))
+
             # getting feature names
             feature_names = preprocessor.get_feature_names_out()
 
@@ -146,6 +180,129 @@ class DataProcessing:
         except Exception as e:
             raise CustomException(e, sys)
 
+    def fit_preprocessor_streaming(self, train_path) -> Pipeline:
+        """
+        This function fits the preprocessor from running statistics over chunks of the raw training dataset.
+
+        The scalers are fitted with partial_fit and the category vocabularies are the union of the values
+        seen in every chunk. The preprocessor is then fitted on a small frame holding each vocabulary
+        value once, so the cleaning step and the encoders learn exactly what a full fit would learn,
+        and the scaler statistics are replaced by the running ones.
+        """
+        try:
+            logging.info('Fitting the preprocessor over chunks of the training dataset.')
+
+            preprocessor = None
+            scalers: Dict[str, StandardScaler] = {}
+            vocabularies: Dict[str, set] = {}
+
+            for chunk in iter_frames(train_path, self.processor_config.chunk_size, RAW_SCHEMA):
+                X_chunk, _ = self.separate_target(chunk)
+
+                if preprocessor is None:
+                    preprocessor = self.build_preprocessor(X_chunk)
+                    dtypes = X_chunk.dtypes
+                    normalizer, column_transformer = preprocessor.named_steps['normalizer'], preprocessor.named_steps['columns']
+                    # only the encoded columns have a vocabulary, the numeric strings such as TotalCharges
+                    # would grow with the data and only need a placeholder
+                    categorical_columns = self.encoded_columns(preprocessor)
+                    vocabularies = {column: set() for column in categorical_columns}
+
+                # the raw values, the cleaning step decides what to replace once it sees all of them
+                for column in categorical_columns:
+                    vocabularies[column].update(X_chunk[column].dropna().unique())
+
+                # the cleaning of the numeric columns does not depend on the other chunks
+                X_clean = clone(normalizer).fit_transform(X_chunk)
+                for name, pipeline, columns in column_transformer.transformers:
+                    if not isinstance(pipeline[-1], StandardScaler):
+                        continue
+                    # the steps before the scaler are stateless, so fitting them per chunk gives the same output
+                    for step in pipeline.steps[:-1]:
+                        if not isinstance(step[1], (SimpleImputer, FunctionTransformer)) or getattr(step[1], 'strategy', 'constant') != 'constant':
+                            raise ValueError(f'The {step[0]} step of {name} cannot be fitted chunk by chunk.')
+                    values = clone(pipeline[:-1]).fit_transform(X_clean[columns]) if len(pipeline) > 1 else X_clean[columns]
+                    scalers.setdefault(name, StandardScaler()).partial_fit(values)
+
+            if preprocessor is None:
+                raise ValueError(f'No rows found in {train_path}.')
+
+            preprocessor.fit(self.vocabulary_frame(vocabularies, dtypes))
+
+            for name, scaler in scalers.items():
+                fitted_scaler = preprocessor.named_steps['columns'].named_transformers_[name][-1]
+                for attribute in ('mean_', 'var_', 'scale_', 'n_samples_seen_'):
+                    setattr(fitted_scaler, attribute, getattr(scaler, attribute))
+
+            logging.info('Preprocessor fitted successfully.')
+            return preprocessor
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def vocabulary_frame(self, vocabularies: Dict[str, set], dtypes: pd.Series) -> pd.DataFrame:
+        """
+        This function builds the frame the preprocessor is fitted on, as long as the largest vocabulary.
+        """
+        # one row per vocabulary value, the other columns only need a valid placeholder, a float string
+        # for the numeric columns stored as strings so they are coerced to float like the real values
+        n_rows = max((len(values) for values in vocabularies.values()), default=1)
+        return pd.DataFrame({
+            column: (sorted(vocabularies[column]) * n_rows)[:n_rows] if column in vocabularies else ['0.0'] * n_rows if dtypes[column] == object else [0] * n_rows
+            for column in dtypes.index
+        }).astype(dtypes)
+
+    def transform_streaming(self, preprocessor, raw_path, processed_path) -> None:
+        """
+        This function transforms a raw dataset chunk by chunk and appends the processed chunks to processed_path.
+        """
+        try:
+            feature_names = preprocessor.get_feature_names_out()
+            schema = processed_schema(list(feature_names) + ['Churn'])
+
+            with FrameWriter(processed_path, schema) as writer:
+                for chunk in iter_frames(raw_path, self.processor_config.chunk_size, RAW_SCHEMA):
+                    X_chunk, y_chunk = self.separate_target(chunk)
+                    X_processed = preprocessor.transform(X_chunk)
+                    # a chunk can fall under the sparse threshold of the ColumnTransformer
+                    if hasattr(X_processed, 'toarray'):
+                        X_processed = X_processed.toarray()
+                    processed = pd.DataFrame(X_processed, columns=feature_names)
+                    processed['Churn'] = y_chunk.values
+                    writer.write(processed)
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    @profiled('data_processing')
+    def process_data_streaming(self, train_path, test_path) -> None:
+        """
+        This function fits the preprocessor and writes the processed datasets without loading a whole dataset.
+        """
+        try:
+            logging.info('Streaming data processing started.')
+            preprocessor = self.fit_preprocessor_streaming(train_path)
+
+            if self.processor_config.data_quality_report:
+                normalizer = preprocessor.named_steps['normalizer']
+                clean_chunks = lambda: (
+                    normalizer.transform(self.separate_target(chunk)[0])
+                    for chunk in iter_frames(train_path, self.processor_config.chunk_size, RAW_SCHEMA)
+                )
+                self.log_outlier_report(streaming_outlier_report(clean_chunks, self.scaled_columns(preprocessor)))
+
+            os.makedirs(os.path.dirname(self.processor_config.train_processed_data_path), exist_ok=True)
+            self.transform_streaming(preprocessor, train_path, self.processor_config.train_processed_data_path)
+            self.transform_streaming(preprocessor, test_path, self.processor_config.test_processed_data_path)
+
+            with open(self.processor_config.processor_data_path, 'wb') as f:
+                pickle.dump(preprocessor, f)
+
+            logging.info('Datasets and Processor saved successfully.')
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
     def save_data(self, train_processed, test_processed, preprocessor) -> None:
         """
         This function saves the processed training and testing datasets, and the preprocessor object.
@@ -156,8 +313,8 @@ class DataProcessing:
             os.makedirs(os.path.dirname(self.processor_config.train_processed_data_path), exist_ok=True)
 
             # saving the datasets
-            train_processed.to_csv(self.processor_config.train_processed_data_path, index=False, header=True)
-            test_processed.to_csv(self.processor_config.test_processed_data_path, index=False, header=True)
+            save_frame(train_processed, self.processor_config.train_processed_data_path, processed_schema(train_processed.columns))
+            save_frame(test_processed, self.processor_config.test_processed_data_path, processed_schema(test_processed.columns))
 
             # saving the preprocessor
             with open(self.processor_config.processor_data_path, 'wb') as f:
@@ -170,11 +327,14 @@ class DataProcessing:
 
 if __name__ == '__main__':
 
-    train_path = 'artifacts/raw/train.csv'
-    test_path = 'artifacts/raw/test.csv'
+    train_path = artifact_path(os.path.join('artifacts', 'raw'), 'train')
+    test_path = artifact_path(os.path.join('artifacts', 'raw'), 'test')
 
     data_processor = DataProcessing()
 
-    train_df, test_df = data_processor.load_data(train_path, test_path)
-    train_processed, test_processed, preprocessor = data_processor.process_data(train_df, test_df)
-    data_processor.save_data(train_processed, test_processed, preprocessor)
\ No newline at end of file
+    if data_processor.processor_config.mode == 'streaming':
+        data_processor.process_data_streaming(train_path, test_path)
+    else:
+        train_df, test_df = data_processor.load_data(train_path, test_path)
+        train_processed, test_processed, preprocessor = data_processor.process_data(train_df, test_df)
+        data_processor.save_data(train_processed, test_processed, preprocessor)
\ No newline at end of file
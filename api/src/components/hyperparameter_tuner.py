@@ -0,0 +1,222 @@
+import numpy as np
+import os
+import sys
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import mlflow
+import optuna
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import StratifiedKFold
+from sklearn.metrics import get_scorer
+
+from src.logger import logging
+from src.exception import CustomException
+from src.utils.artifact_io import artifact_path, load_frame
+from src.utils.smote_cache import SmoteCache, SmoteCacheConfig
+
+@dataclass
+class HyperparameterTunerConfig:
+    """
+    This is a special class which is used for the paths and settings of the hyperparameter search.
+    """
+    study_storage_path: str = os.path.join('artifacts', 'tuning', 'study.db')
+    # plain .npy files, members of an .npz archive cannot be memory-mapped
+    resampled_X_path: str = os.path.join('artifacts', 'tuning', 'resampled_X.npy')
+    resampled_y_path: str = os.path.join('artifacts', 'tuning', 'resampled_y.npy')
+    best_params_path: str = os.path.join('artifacts', 'tuning', 'best_params.json')
+    study_name: str = 'churn-logistic-regression'
+    # the study keeps running until it has n_trials finished trials, so an interrupted search resumes
+    n_trials: int = field(default_factory=lambda: int(os.getenv('TUNING_TRIALS', '100')))
+    n_jobs: int = field(default_factory=lambda: int(os.getenv('TUNING_JOBS', str(os.cpu_count() or 1))))
+    n_folds: int = 5
+    scoring: str = 'recall'
+    random_state: int = 42
+
+def suggest_params(trial: optuna.Trial) -> dict:
+    """
+    This function samples the Logistic Regression parameters, the search space is the one from the model_training notebook.
+    """
+    solver = trial.suggest_categorical('solver', ['lbfgs', 'liblinear', 'saga', 'newton-cg', 'sag'])
+
+    params = {
+        'C': trial.suggest_float('C', 1e-3, 10, log=True),
+        'max_iter': trial.suggest_int('max_iter', 1000, 3000),
+        'tol': trial.suggest_float('tol', 1e-5, 1e-1, log=True),
+        'class_weight': trial.suggest_categorical('class_weight', [None, 'balanced']),
+        'fit_intercept': trial.suggest_categorical('fit_intercept', [True, False]),
+        'intercept_scaling': trial.suggest_float('intercept_scaling', 0.1, 10),
+        'solver': solver
+    }
+
+    if solver == 'liblinear':
+        params['l1_ratio'] = trial.suggest_categorical('l1_ratio_liblinear', [0.0, 1.0])
+    elif solver == 'saga':
+        params['l1_ratio'] = trial.suggest_float('l1_ratio', 0, 1)
+    else:
+        params['l1_ratio'] = 0.0
+
+    return params
+
+def study_storage(config: HyperparameterTunerConfig) -> optuna.storages.RDBStorage:
+    """
+    This function returns the SQLite storage shared by the worker processes.
+    """
+    return optuna.storages.RDBStorage(
+        f'sqlite:///{config.study_storage_path}',
+        engine_kwargs={'connect_args': {'timeout': 60}}
+    )
+
+def study_sampler(config: HyperparameterTunerConfig, worker: int = 0) -> optuna.samplers.TPESampler:
+    """
+    This function returns the sampler of a worker, seeded from the base seed so the search can be reproduced.
+
+    Each worker gets its own seed, otherwise every worker would propose the same parameters.
+    """
+    return optuna.samplers.TPESampler(seed=config.random_state + worker)
+
+def study_pruner() -> optuna.pruners.MedianPruner:
+    """
+    This function returns the pruner stopping the trials that are worse than the median after a fold.
+    """
+    return optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=1)
+
+def run_trials(config: HyperparameterTunerConfig, n_trials: int, worker: int = 0) -> None:
+    """
+    This function runs trials of the shared study in a worker process.
+    """
+    # the resampled matrix is computed once by the parent and only memory-mapped here,
+    # so the workers share its pages instead of each holding a copy
+    X = np.load(config.resampled_X_path, mmap_mode='r')
+    y = np.load(config.resampled_y_path, mmap_mode='r')
+    folds = list(StratifiedKFold(n_splits=config.n_folds, shuffle=True, random_state=config.random_state).split(X, y))
+    scorer = get_scorer(config.scoring)
+
+    def objective(trial: optuna.Trial) -> float:
+        params = suggest_params(trial)
+        trial.set_user_attr('params', params)
+
+        scores = []
+        for step, (train_index, valid_index) in enumerate(folds):
+            model = LogisticRegression(**params, random_state=config.random_state)
+            model.fit(X[train_index], y[train_index])
+            scores.append(scorer(model, X[valid_index], y[valid_index]))
+
+            # stopping the trial after a fold when it is already worse than the median trial
+            trial.report(float(np.mean(scores)), step)
+            if trial.should_prune():
+                raise optuna.TrialPruned()
+
+        return float(np.mean(scores))
+
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    # the sampler and the pruner are not stored with the study, every worker has to pass them again
+    study = optuna.load_study(
+        study_name=config.study_name,
+        storage=study_storage(config),
+        sampler=study_sampler(config, worker),
+        pruner=study_pruner()
+    )
+    study.optimize(objective, n_trials=n_trials)
+
+class HyperparameterTuner:
+    def __init__(self) -> None:
+        self.tuner_config = HyperparameterTunerConfig()
+
+    def prepare_data(self, train_processed_df) -> None:
+        """
+        This function applies SMOTE once and caches the resampled matrix for every trial.
+        """
+        try:
+            logging.info('Resampling the training dataset for the hyperparameter search.')
+            X_train = train_processed_df.drop('Churn', axis=1)
+            y_train = train_processed_df['Churn']
+
+            # same cache as model_trainer, so the stage that runs second reuses the resampled data
+            smote_cache = SmoteCache(SmoteCacheConfig(random_state=self.tuner_config.random_state))
+            X_resampled, y_resampled = smote_cache.fit_resample(X_train, y_train)
+
+            os.makedirs(os.path.dirname(self.tuner_config.resampled_X_path), exist_ok=True)
+            np.save(self.tuner_config.resampled_X_path, np.asarray(X_resampled, dtype=np.float64))
+            np.save(self.tuner_config.resampled_y_path, np.asarray(y_resampled))
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def tune(self) -> dict:
+        """
+        This function runs the remaining trials on all the CPU cores and returns the best parameters.
+        """
+        try:
+            config = self.tuner_config
+            logging.info('Hyperparameter search started.')
+
+            study = optuna.create_study(
+                study_name=config.study_name,
+                storage=study_storage(config),
+                direction='maximize',
+                sampler=study_sampler(config),
+                pruner=study_pruner(),
+                load_if_exists=True
+            )
+
+            finished = [trial for trial in study.trials if trial.state.is_finished()]
+            remaining = max(config.n_trials - len(finished), 0)
+            logging.info(f'{len(finished)} trials found in the study, running {remaining} more on {config.n_jobs} workers.')
+
+            start = time.perf_counter()
+            if remaining:
+                n_jobs = min(config.n_jobs, remaining)
+                # spreading the remaining trials as evenly as possible over the workers
+                shares = [remaining // n_jobs + (1 if i < remaining % n_jobs else 0) for i in range(n_jobs)]
+                with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                    for future in [executor.submit(run_trials, config, share, worker) for worker, share in enumerate(shares)]:
+                        future.result()
+            wall_time = time.perf_counter() - start
+
+            study = optuna.load_study(study_name=config.study_name, storage=study_storage(config))
+            best_params = study.best_trial.user_attrs['params']
+            states = [trial.state for trial in study.trials]
+
+            mlflow.set_experiment('Churn Prediction')
+
+            with mlflow.start_run(run_name='hyperparameter_tuning'):
+                mlflow.log_params({f'best_{name}': value for name, value in best_params.items()})
+                mlflow.log_metric(f'best_{config.scoring}', study.best_value)
+                mlflow.log_metric('search_wall_time', wall_time)
+                mlflow.log_metric('trials_per_second', remaining / wall_time if wall_time > 0 else 0.0)
+                mlflow.log_metric('completed_trials', states.count(optuna.trial.TrialState.COMPLETE))
+                mlflow.log_metric('pruned_trials', states.count(optuna.trial.TrialState.PRUNED))
+
+            logging.info(f'Best {config.scoring}: {study.best_value:.3f} with {best_params}')
+            logging.info(f'{remaining} trials in {wall_time:.1f}s.')
+
+            return best_params
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def save_params(self, best_params) -> None:
+        """
+        This function saves the best parameters for the model_trainer stage.
+        """
+        try:
+            with open(self.tuner_config.best_params_path, 'w') as f:
+                json.dump(best_params, f, indent=4)
+
+            logging.info('Best parameters saved successfully.')
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+if __name__ == '__main__':
+
+    train_processed_path = artifact_path(os.path.join('artifacts', 'processed'), 'train')
+
+    tuner = HyperparameterTuner()
+    train_processed_df = load_frame(train_processed_path, memory_map=True)
+    tuner.prepare_data(train_processed_df)
+    best_params = tuner.tune()
+    tuner.save_params(best_params)
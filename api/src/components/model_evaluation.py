@@ -1,5 +1,6 @@
 import pandas as pd
 import matplotlib.pyplot as plt
+import os
 import sys
 import pickle
 
@@ -9,15 +10,21 @@ from sklearn.metrics import recall_score, precision_score, f1_score, roc_curve,
 
 from src.logger import logging
 from src.exception import CustomException
+from src.utils.artifact_io import artifact_path, load_frame
+from src.utils.profiling import StageProfiler
+from src.utils.scoring import ScoringConfig, score
 
 class ModelEvaluation:
+    def __init__(self) -> None:
+        self.scoring_config = ScoringConfig()
 
     def load_data(self, test_processed_path) -> pd.DataFrame:
         """
         This function loads the processed testing dataset.
         """
         try:
-            test_processed_df = pd.read_csv(test_processed_path)
+            # the processed features are a wide float matrix, memory-mapped instead of parsed
+            test_processed_df = load_frame(test_processed_path, memory_map=True)
             return test_processed_df
         except Exception as e:
             raise CustomException(e, sys)
@@ -33,40 +40,42 @@ class ModelEvaluation:
         except Exception as e:
             raise CustomException(e, sys)
         
-    def evaluate_model(self, test_processed_df, model):
+    def evaluate_model(self, test_processed_df, model) -> dict:
         """
-        This function evaluates the trained model on the testing dataset.
+        This function evaluates the trained model on the testing dataset and returns the metrics.
         """
         try:
             logging.info('Model evaluation started.')
 
-            X_test = test_processed_df.drop('Churn', axis=1)
-            y_test = test_processed_df['Churn']
+            mlflow.set_experiment('Churn Prediction')
 
-            logging.info('Making predictions on test data...')
+            # the profiler runs inside the evaluation run, so its metrics are logged next to the scores
+            with mlflow.start_run(run_name='model_evaluation'), StageProfiler('model_evaluation', rows=len(test_processed_df)):
+                X_test = test_processed_df.drop('Churn', axis=1)
+                y_test = test_processed_df['Churn']
 
-            y_pred = model.predict(X_test)
-            y_prob = model.predict_proba(X_test)[:,1]
+                logging.info('Making predictions on test data...')
 
-            logging.info('Calculating metrics...')
-            recall = recall_score(y_test, y_pred)
-            precision = precision_score(y_test, y_pred)
-            f1 = f1_score(y_test, y_pred)
-            auc_score = roc_auc_score(y_test, y_prob)
-            fpr, tpr, thresholds = roc_curve(y_test, y_prob)
+                # a single predict_proba call, the labels are thresholded from the probabilities
+                y_pred, y_prob = score(model, X_test, self.scoring_config.threshold)
 
-            fig = plt.figure(figsize=(6, 4))
-            plt.plot(fpr, tpr, label=f'Logistic Regression (AUC={auc_score:.3f})')
-            plt.plot([0, 1], [0, 1], 'k--', label='Random Classifier')
-            plt.grid(True, alpha=0.3)
-            plt.xlabel('False Positive Rate')
-            plt.ylabel('True Positive Rate')
-            plt.title('ROC curve for Logistic Regression')
-            plt.legend()
+                logging.info('Calculating metrics...')
+                recall = recall_score(y_test, y_pred)
+                precision = precision_score(y_test, y_pred)
+                f1 = f1_score(y_test, y_pred)
+                auc_score = roc_auc_score(y_test, y_prob)
+                fpr, tpr, thresholds = roc_curve(y_test, y_prob)
 
-            mlflow.set_experiment('Churn Prediction')
+                fig = plt.figure(figsize=(6, 4))
+                plt.plot(fpr, tpr, label=f'Logistic Regression (AUC={auc_score:.3f})')
+                plt.plot([0, 1], [0, 1], 'k--', label='Random Classifier')
+                plt.grid(True, alpha=0.3)
+                plt.xlabel('False Positive Rate')
+                plt.ylabel('True Positive Rate')
+                plt.title('ROC curve for Logistic Regression')
+                plt.legend()
 
-            with mlflow.start_run(run_name='model_evaluation'):
+                mlflow.log_param('threshold', self.scoring_config.threshold)
                 mlflow.log_metric('recall', recall)
                 mlflow.log_metric('precision', precision)
                 mlflow.log_metric('f1_score', f1)
@@ -75,13 +84,21 @@ class ModelEvaluation:
                 mlflow.log_figure(fig, 'roc_curve.png')
                 plt.close()
 
+            logging.info(f'Threshold: {self.scoring_config.threshold}')
             logging.info(f'Recall: {recall:.3f}, Precision: {precision:.3f}, F1 Score: {f1:.3f} AUC Score: {auc_score:.3f}')
             logging.info('Model evaluation completed.')
+
+            return {
+                'recall': recall,
+                'precision': precision,
+                'f1_score': f1,
+                'auc_score': auc_score
+            }
         except Exception as e:
             raise CustomException(e, sys)
         
 if __name__ == '__main__':
-    test_processed_path = 'artifacts/processed/test.csv'
+    test_processed_path = artifact_path(os.path.join('artifacts', 'processed'), 'test')
     model_path = 'artifacts/models/model.pkl'
 
     model_evaluator = ModelEvaluation()
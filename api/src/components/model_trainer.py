@@ -1,15 +1,24 @@
 import pandas as pd
 import os
 import sys
+import json
 import pickle
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
 
 import mlflow
-from sklearn.linear_model import LogisticRegression
-from imblearn.over_sampling import SMOTE
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.metrics import roc_auc_score
+from sklearn.pipeline import Pipeline
 
 from src.logger import logging
 from src.exception import CustomException
+from src.utils.artifact_io import artifact_path, iter_frames, load_frame
+from src.utils.scoring import predict_positive_proba
+from src.utils.profiling import StageProfiler
+from src.utils.smote_cache import SmoteCache
 
 @dataclass
 class ModelTrainerConfig:
@@ -17,18 +26,54 @@ class ModelTrainerConfig:
     This is a special class which is used for the path of model.
     """
     trained_model_path: str = os.path.join('artifacts', 'models', 'model.pkl')
+    # last batch model, kept outside artifacts/models as the reference of the streaming mode
+    reference_model_path: str = os.path.join('artifacts', 'reference', 'batch_model.pkl')
+    processor_path: str = os.path.join('artifacts', 'preprocessor.pkl')
+    # preprocessor and model in one artifact, this is what the API serves
+    inference_pipeline_path: str = os.path.join('artifacts', 'models', 'inference_pipeline.pkl')
+    # written by the hyperparameter_tuning stage, DEFAULT_PARAMS are used when it is missing
+    best_params_path: str = os.path.join('artifacts', 'tuning', 'best_params.json')
+    # batch fits LogisticRegression in memory, streaming fits an SGDClassifier chunk by chunk
+    mode: str = field(default_factory=lambda: os.getenv('TRAINING_MODE', 'batch'))
+    chunk_size: int = field(default_factory=lambda: int(os.getenv('TRAINING_CHUNK_SIZE', '10000')))
+    n_epochs: int = field(default_factory=lambda: int(os.getenv('TRAINING_EPOCHS', '10')))
+    random_state: int = 42
+
+# parameters found in the model_training notebook, used until the hyperparameter_tuning stage has run
+DEFAULT_PARAMS = {
+    'solver': 'sag',
+    'C': 0.30488401774858853,
+    'max_iter': 1311,
+    'tol': 0.07272504817997558,
+    'class_weight': None,
+    'fit_intercept': True,
+    'intercept_scaling': 0.2339737361256624
+}
 
 class ModelTrainer:
     def __init__(self) -> None:
         self.model_trainer_config = ModelTrainerConfig()
 
+    def load_params(self) -> dict:
+        """
+        This function returns the tuned parameters when they exist, and the default ones otherwise.
+        """
+        try:
+            if os.path.exists(self.model_trainer_config.best_params_path):
+                with open(self.model_trainer_config.best_params_path) as f:
+                    return json.load(f)
+            return dict(DEFAULT_PARAMS)
+        except Exception as e:
+            raise CustomException(e, sys)
+
     def load_data(self, train_processed_path) -> pd.DataFrame:
         """
         This function loads the processed training dataset.
         """
         try:
             logging.info('Loading the training datasets.')
-            train_processed_df = pd.read_csv(train_processed_path)
+            # the processed features are a wide float matrix, memory-mapped instead of parsed
+            train_processed_df = load_frame(train_processed_path, memory_map=True)
             logging.info('Training dataset loaded successsfully.')
 
             return train_processed_df
@@ -45,15 +90,18 @@ class ModelTrainer:
             X_train = train_processed_df.drop('Churn', axis=1)
             y_train = train_processed_df['Churn']
 
-            smote = SMOTE(random_state=42)
-            X_train_resampled, y_train_resampled = smote.fit_resample(X_train, y_train)
-
             mlflow.set_experiment('Churn Prediction')
 
             with mlflow.start_run(run_name='model_training'):
-                
-                model = LogisticRegression(**params, random_state=42)
-                model.fit(X_train_resampled, y_train_resampled)
+
+                # profiled apart from the fit, a cache hit here shows up as a near zero smote_wall_time
+                with StageProfiler('smote', rows=len(X_train)):
+                    # cached on disk, re-running with new parameters on the same data skips the resampling
+                    X_train_resampled, y_train_resampled = SmoteCache().fit_resample(X_train, y_train)
+
+                with StageProfiler('model_fit', rows=len(X_train_resampled)):
+                    model = LogisticRegression(**params, random_state=42)
+                    model.fit(X_train_resampled, y_train_resampled)
 
                 mlflow.log_params(params)
                 mlflow.sklearn.log_model(model, name='model')
@@ -65,9 +113,88 @@ class ModelTrainer:
         except Exception as e:
             raise CustomException(e, sys)
         
-    def save_model(self, model) -> None:
+    def train_model_streaming(self, params, train_processed_path) -> SGDClassifier:
         """
-        This function saves the trained model.
+        This function trains a logistic model with partial_fit over chunks of the training dataset.
+
+        Only one chunk is in memory at a time. SMOTE needs the whole dataset, so it is replaced by
+        balanced class weights computed in a first pass over the labels.
+        """
+        try:
+            logging.info('Streaming model training started.')
+            chunk_size = self.model_trainer_config.chunk_size
+
+            # first pass, only the labels are kept to weight the classes
+            counts = pd.Series(dtype='int64')
+            for chunk in iter_frames(train_processed_path, chunk_size):
+                counts = counts.add(chunk['Churn'].value_counts(), fill_value=0)
+            classes = np.sort(counts.index.to_numpy().astype(np.int64))
+            class_weight = {int(label): float(counts.sum() / (len(classes) * counts[label])) for label in classes}
+            logging.info(f'Class counts {counts.astype(int).to_dict()}, weights {class_weight}.')
+
+            model = SGDClassifier(**params, loss='log_loss', random_state=self.model_trainer_config.random_state)
+            rng = np.random.default_rng(self.model_trainer_config.random_state)
+
+            mlflow.set_experiment('Churn Prediction')
+
+            with mlflow.start_run(run_name='model_training_streaming'):
+                with StageProfiler('model_fit', rows=int(counts.sum()) * self.model_trainer_config.n_epochs):
+                    for epoch in range(self.model_trainer_config.n_epochs):
+                        for chunk in iter_frames(train_processed_path, chunk_size):
+                            # shuffling inside the chunk, SGD is sensitive to runs of the same class
+                            chunk = chunk.iloc[rng.permutation(len(chunk))]
+                            X_chunk = chunk.drop('Churn', axis=1)
+                            y_chunk = chunk['Churn'].to_numpy()
+                            sample_weight = np.vectorize(class_weight.get)(y_chunk)
+                            model.partial_fit(X_chunk, y_chunk, classes=classes, sample_weight=sample_weight)
+                        logging.info(f'Epoch {epoch + 1}/{self.model_trainer_config.n_epochs} done.')
+
+                mlflow.log_params(params)
+                mlflow.log_params({'training_mode': 'streaming', 'chunk_size': chunk_size, 'n_epochs': self.model_trainer_config.n_epochs})
+                mlflow.sklearn.log_model(model, name='model')
+
+            logging.info('Model trained successfully.')
+            return model
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def compare_models(self, model, reference_model, test_processed_path) -> dict:
+        """
+        This function reports how close a model gets to a reference model on the testing dataset, chunk by chunk.
+        """
+        try:
+            y_test, probabilities, reference_probabilities = [], [], []
+            for chunk in iter_frames(test_processed_path, self.model_trainer_config.chunk_size):
+                X_chunk = chunk.drop('Churn', axis=1)
+                y_test.append(chunk['Churn'].to_numpy())
+                probabilities.append(predict_positive_proba(model, X_chunk))
+                reference_probabilities.append(predict_positive_proba(reference_model, X_chunk))
+
+            y_test = np.concatenate(y_test)
+            probabilities = np.concatenate(probabilities)
+            reference_probabilities = np.concatenate(reference_probabilities)
+
+            comparison = {
+                'auc': roc_auc_score(y_test, probabilities),
+                'reference_auc': roc_auc_score(y_test, reference_probabilities),
+                'label_agreement': float(np.mean((probabilities >= 0.5) == (reference_probabilities >= 0.5))),
+                'mean_probability_difference': float(np.mean(np.abs(probabilities - reference_probabilities))),
+                'max_probability_difference': float(np.max(np.abs(probabilities - reference_probabilities)))
+            }
+
+            with mlflow.start_run(run_name='streaming_vs_batch'):
+                mlflow.log_metrics(comparison)
+
+            logging.info(f'Streaming model compared to the batch model: {comparison}')
+            return comparison
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def save_model(self, model, preprocessor=None) -> None:
+        """
+        This function saves the trained model, the preprocessor is read from processor_path when it is not given.
         """
         try:
             os.makedirs(os.path.dirname(self.model_trainer_config.trained_model_path), exist_ok=True)
@@ -76,6 +203,22 @@ class ModelTrainer:
             with open(self.model_trainer_config.trained_model_path, 'wb') as f:
                 pickle.dump(model, f)
 
+            # a streaming model never replaces the reference, so the comparison is always against a batch model
+            if isinstance(model, LogisticRegression):
+                os.makedirs(os.path.dirname(self.model_trainer_config.reference_model_path), exist_ok=True)
+                with open(self.model_trainer_config.reference_model_path, 'wb') as f:
+                    pickle.dump(model, f)
+
+            # chaining the cleaning, the column transformations and the model for serving
+            if preprocessor is None:
+                with open(self.model_trainer_config.processor_path, 'rb') as f:
+                    preprocessor = pickle.load(f)
+            inference_pipeline = Pipeline(preprocessor.steps + [('model', model)])
+
+            logging.info('Saving the inference pipeline.')
+            with open(self.model_trainer_config.inference_pipeline_path, 'wb') as f:
+                pickle.dump(inference_pipeline, f)
+
             logging.info('Model saved successfully.')
 
         except Exception as e:
@@ -83,19 +226,35 @@ class ModelTrainer:
 
 if __name__ == '__main__':
 
-    train_processed_path = 'artifacts/processed/train.csv'
+    train_processed_path = artifact_path(os.path.join('artifacts', 'processed'), 'train')
 
-    params = {
-                'solver': 'sag', 
-                'C': 0.30488401774858853, 
-                'max_iter': 1311, 
-                'tol': 0.07272504817997558, 
-                'class_weight': None, 
-                'fit_intercept': True, 
-                'intercept_scaling': 0.2339737361256624
+    # averaged SGD with a decaying step size, alpha plays the role of 1 / (C * n_samples)
+    streaming_params = {
+                'alpha': 1e-4,
+                'penalty': 'l2',
+                'learning_rate': 'adaptive',
+                'eta0': 0.01,
+                'average': True
             }
 
     model_trainer = ModelTrainer()
-    train_processed_df = model_trainer.load_data(train_processed_path)
-    model = model_trainer.train_model(params, train_processed_df)
+    params = model_trainer.load_params()
+
+    if model_trainer.model_trainer_config.mode == 'streaming':
+        test_processed_path = artifact_path(os.path.join('artifacts', 'processed'), 'test')
+        model = model_trainer.train_model_streaming(streaming_params, train_processed_path)
+
+        # the last batch model, when there is one, is the reference for the comparison
+        reference_model: Optional[LogisticRegression] = None
+        if os.path.exists(model_trainer.model_trainer_config.reference_model_path):
+            with open(model_trainer.model_trainer_config.reference_model_path, 'rb') as f:
+                reference_model = pickle.load(f)
+        if reference_model is not None:
+            model_trainer.compare_models(model, reference_model, test_processed_path)
+        else:
+            logging.info('No batch model to compare with, run the batch mode once to create the reference.')
+    else:
+        train_processed_df = model_trainer.load_data(train_processed_path)
+        model = model_trainer.train_model(params, train_processed_df)
+
     model_trainer.save_model(model)
\ No newline at end of file
@@ -1,32 +1,137 @@
 import sys
 import os
+import threading
+from dataclasses import dataclass, field
+from typing import Optional
+
 from dotenv import load_dotenv
 from pymongo import MongoClient
+from pymongo.database import Database
 from src.exception import CustomException
 from src.logger import logging
 
+# the .env file is read once per process, before the first configuration is built
+_dotenv_lock = threading.Lock()
+_dotenv_loaded = False
+
+def load_environment() -> None:
+    """
+    This function loads the .env file the first time it is called.
+    """
+    global _dotenv_loaded
+    with _dotenv_lock:
+        if not _dotenv_loaded:
+            load_dotenv()
+            _dotenv_loaded = True
+
+def getenv(name: str, default: str) -> str:
+    load_environment()
+    return os.getenv(name, default)
+
+@dataclass
+class MongoDBConfig:
+    """
+    This is a special class which is used for the connection settings of MongoDB Atlas.
+    """
+    uri: str = field(default_factory=lambda: getenv('MONGODB_URI', ''))
+    database_name: str = field(default_factory=lambda: getenv('MONGODB_DATABASE', ''))
+    max_pool_size: int = field(default_factory=lambda: int(getenv('MONGODB_MAX_POOL_SIZE', '50')))
+    min_pool_size: int = field(default_factory=lambda: int(getenv('MONGODB_MIN_POOL_SIZE', '0')))
+    # wire compression, zstd and snappy also need the zstandard and python-snappy packages
+    compressors: str = field(default_factory=lambda: getenv('MONGODB_COMPRESSORS', 'zlib'))
+    server_selection_timeout_ms: int = field(default_factory=lambda: int(getenv('MONGODB_SERVER_SELECTION_TIMEOUT_MS', '10000')))
+    connect_timeout_ms: int = field(default_factory=lambda: int(getenv('MONGODB_CONNECT_TIMEOUT_MS', '10000')))
+    # 0 means no socket timeout, long ingestion cursors can take a while between batches
+    socket_timeout_ms: int = field(default_factory=lambda: int(getenv('MONGODB_SOCKET_TIMEOUT_MS', '0')))
+    read_preference: str = field(default_factory=lambda: getenv('MONGODB_READ_PREFERENCE', 'primaryPreferred'))
+    # documents per cursor round trip
+    batch_size: int = field(default_factory=lambda: int(getenv('MONGODB_BATCH_SIZE', '10000')))
+
 class MongoDBConnection:
     """
     This class will connect to the remote Mongodb Atlas where the data is stored.
+
+    Every instance shares one pooled MongoClient per process. The client is created on first use,
+    and a forked child creates its own, because a MongoClient must not be used across a fork.
     """
-    client = None
-    def __init__(self) -> None:
-        try:
-            load_dotenv()
-            if MongoDBConnection.client is None:
-                self.initialise_mongodb()
-        except Exception as e:
-            raise CustomException(e, sys)
+    _client: Optional[MongoClient] = None
+    _client_pid: Optional[int] = None
+    _lock = threading.Lock()
 
-    def initialise_mongodb(self) -> None:
+    def __init__(self, config: Optional[MongoDBConfig] = None) -> None:
         try:
-            MONGODB_URI = os.getenv('MONGODB_URI')
-            MONGODB_DATABASE = os.getenv('MONGODB_DATABASE')
-            MongoDBConnection.client = MongoClient(MONGODB_URI)
-            self.database = MongoDBConnection.client[MONGODB_DATABASE]
-            logging.info('Connected to Mongodb.')
+            self.mongodb_config = config or MongoDBConfig()
         except Exception as e:
             raise CustomException(e, sys)
-        
+
+    @classmethod
+    def get_client(cls, config: Optional[MongoDBConfig] = None) -> MongoClient:
+        """
+        This function returns the client of the current process, creating it the first time.
+        """
+        client = cls._client
+        if client is not None and cls._client_pid == os.getpid():
+            return client
+
+        with cls._lock:
+            # checked again under the lock, another thread may have created it meanwhile
+            if cls._client is None or cls._client_pid != os.getpid():
+                try:
+                    config = config or MongoDBConfig()
+                    cls._client = MongoClient(
+                        config.uri,
+                        maxPoolSize=config.max_pool_size,
+                        minPoolSize=config.min_pool_size,
+                        compressors=config.compressors or None,
+                        serverSelectionTimeoutMS=config.server_selection_timeout_ms,
+                        connectTimeoutMS=config.connect_timeout_ms,
+                        socketTimeoutMS=config.socket_timeout_ms or None,
+                        readPreference=config.read_preference,
+                        connect=False
+                    )
+                    cls._client_pid = os.getpid()
+                    logging.info(f'Connected to Mongodb, pool of up to {config.max_pool_size} connections.')
+                except Exception as e:
+                    raise CustomException(e, sys)
+            return cls._client
+
+    @classmethod
+    def use_client(cls, client) -> None:
+        """
+        This function installs an already built client, for example a local stand-in in tests.
+        """
+        with cls._lock:
+            cls._client = client
+            cls._client_pid = os.getpid()
+
+    @classmethod
+    def close(cls) -> None:
+        """
+        This function closes the client of the current process.
+        """
+        with cls._lock:
+            if cls._client is not None and cls._client_pid == os.getpid():
+                cls._client.close()
+            cls._client = None
+            cls._client_pid = None
+
+    @classmethod
+    def _after_fork(cls) -> None:
+        # the parent's lock may have been held during the fork, the child starts with a fresh one
+        cls._lock = threading.Lock()
+        cls._client = None
+        cls._client_pid = None
+
+    @property
+    def client(self) -> MongoClient:
+        return self.get_client(self.mongodb_config)
+
+    @property
+    def database(self) -> Database:
+        return self.client[self.mongodb_config.database_name]
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=MongoDBConnection._after_fork)
+
 if __name__ == '__main__':
-    connection = MongoDBConnection()
\ No newline at end of file
+    connection = MongoDBConnection()
@@ -9,15 +9,31 @@ This is a cutom logging setup for saving the logs after each pipeline execution.
 
 LOG_FILE = f'{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}.log'
 logs_path = os.path.join(os.getcwd(), 'logs', LOG_FILE)
-os.makedirs(logs_path, exist_ok=True)
 
 LOG_FILE_PATH = os.path.join(logs_path, LOG_FILE)
 
+# set to 0 to only log to stdout, for example in a container whose output is already collected
+LOG_TO_FILE = os.getenv('LOG_TO_FILE', '1') == '1'
+
+class LazyFileHandler(logging.FileHandler):
+    """
+    This is a special class which is used for writing the log file without touching the filesystem at import.
+
+    The directory and the file are only created when the first record is written.
+    """
+    def __init__(self, filename: str, mode: str = 'a') -> None:
+        super().__init__(filename, mode, delay=True)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+handlers = [logging.StreamHandler(sys.stdout)]
+if LOG_TO_FILE:
+    handlers.insert(0, LazyFileHandler(LOG_FILE_PATH, mode='a'))
+
 logging.basicConfig(
     format='[ %(asctime)s ] %(lineno)d %(name)s - %(levelname)s - %(message)s',
     level=logging.INFO,
-    handlers=[
-        logging.FileHandler(LOG_FILE_PATH, mode='a'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
\ No newline at end of file
+    handlers=handlers
+)
@@ -0,0 +1,276 @@
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import shutil
+import sys
+import time
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from src.logger import logging
+from src.exception import CustomException
+from src.components.data_ingestion import DataIngestion
+from src.components.data_preprocessing import DataProcessing
+from src.components.model_evaluation import ModelEvaluation
+from src.components.model_trainer import ModelTrainer
+from src.utils import artifact_io, scoring, smote_cache, transformers
+from src.utils.artifact_io import RAW_SCHEMA, apply_schema, load_frame, save_frame
+from src.utils.profiling import StageProfiler
+
+"""
+This is the in-process training pipeline. It runs the four components one after the other, hands the
+DataFrames over in memory and skips every stage whose inputs, code and params did not change.
+The ingestion always runs, the content of the fetched datasets is what tells whether the collection changed.
+
+    python src/pipeline.py
+    python src/pipeline.py --force
+"""
+
+@dataclass
+class TrainingPipelineConfig:
+    """
+    This is a special class which is used for the settings of the stage cache.
+    """
+    cache_dir: str = field(default_factory=lambda: os.getenv('STAGE_CACHE_DIR', os.path.join('artifacts', '.stage_cache')))
+    enabled: bool = field(default_factory=lambda: os.getenv('STAGE_CACHE_ENABLED', '1') == '1')
+    # number of cached results kept per stage, the least recently used ones are removed
+    keep: int = field(default_factory=lambda: int(os.getenv('STAGE_CACHE_KEEP', '3')))
+
+def code_hash(sources) -> str:
+    """
+    This function hashes the source files of the modules or classes a stage depends on.
+    """
+    digest = hashlib.sha256()
+    for source in sources:
+        with open(inspect.getsourcefile(source), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def frames_hash(frames: Dict[str, pd.DataFrame]) -> str:
+    """
+    This function returns a content hash of named DataFrames, covering their columns, dtypes and values.
+    """
+    digest = hashlib.sha256()
+    for name in sorted(frames):
+        df = frames[name]
+        digest.update(json.dumps([name, list(map(str, df.columns)), df.dtypes.astype(str).tolist()]).encode())
+        digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+class CachedOutputs(Mapping):
+    """
+    This class gives access to the outputs of a cached stage and only reads an output from disk when it is used.
+
+    A params-only change reruns training, which reads the processed datasets, but never reads the raw ones.
+    """
+    def __init__(self, path: str, manifest: Dict[str, dict]) -> None:
+        self.path = path
+        self.manifest = manifest
+        self._loaded: Dict[str, Any] = {}
+
+    def __getitem__(self, name: str) -> Any:
+        if name not in self._loaded:
+            entry = self.manifest[name]
+            if entry['type'] == 'frame':
+                self._loaded[name] = load_frame(os.path.join(self.path, name + '.parquet'), entry['dtypes'], memory_map=True)
+            else:
+                with open(os.path.join(self.path, name + '.pkl'), 'rb') as f:
+                    self._loaded[name] = pickle.load(f)
+        return self._loaded[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.manifest)
+
+    def __len__(self) -> int:
+        return len(self.manifest)
+
+class StageCache:
+    """
+    This class stores the outputs of each stage under a key derived from its inputs, code and params.
+
+    The key of a stage includes the keys of the stages it reads from, so a change anywhere upstream
+    changes every key below it. Only the ingested datasets are hashed, the intermediate DataFrames never are.
+    """
+    def __init__(self, config: TrainingPipelineConfig) -> None:
+        self.cache_config = config
+
+    def key(self, stage: str, inputs: List[str], sources, params: dict) -> str:
+        """
+        This function returns the cache key of one run of a stage.
+        """
+        payload = json.dumps({
+            'stage': stage,
+            'inputs': inputs,
+            'code': code_hash(sources),
+            'params': params
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+    def load(self, stage: str, key: str) -> Optional[CachedOutputs]:
+        """
+        This function returns the cached outputs of a stage, or None when they are not cached.
+        """
+        path = os.path.join(self.cache_config.cache_dir, stage, key)
+        manifest_path = os.path.join(path, 'manifest.json')
+        if not os.path.exists(manifest_path):
+            return None
+
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        # the modification time is used as the last access time for the eviction
+        os.utime(path)
+        return CachedOutputs(path, manifest)
+
+    def save(self, stage: str, key: str, outputs: Dict[str, Any]) -> None:
+        """
+        This function stores the outputs of a stage, DataFrames as parquet and everything else pickled.
+        """
+        path = os.path.join(self.cache_config.cache_dir, stage, key)
+        # written in a temporary folder and renamed, so an interrupted run never leaves a partial entry
+        temp_path = path + f'.{os.getpid()}.tmp'
+        os.makedirs(temp_path, exist_ok=True)
+
+        manifest = {}
+        for name, value in outputs.items():
+            if isinstance(value, pd.DataFrame):
+                save_frame(value, os.path.join(temp_path, name + '.parquet'))
+                manifest[name] = {'type': 'frame', 'dtypes': value.dtypes.astype(str).to_dict()}
+            else:
+                with open(os.path.join(temp_path, name + '.pkl'), 'wb') as f:
+                    pickle.dump(value, f)
+                manifest[name] = {'type': 'pickle'}
+
+        with open(os.path.join(temp_path, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=4)
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(temp_path, path)
+        self.evict(stage)
+
+    def evict(self, stage: str) -> None:
+        """
+        This function keeps the most recently used entries of a stage and removes the others.
+        """
+        stage_dir = os.path.join(self.cache_config.cache_dir, stage)
+        entries = sorted(
+            (os.path.join(stage_dir, name) for name in os.listdir(stage_dir) if not name.endswith('.tmp')),
+            key=os.path.getmtime,
+            reverse=True
+        )
+        for path in entries[self.cache_config.keep:]:
+            shutil.rmtree(path, ignore_errors=True)
+
+class TrainingPipeline:
+    def __init__(self, force: bool = False) -> None:
+        self.pipeline_config = TrainingPipelineConfig()
+        self.stage_cache = StageCache(self.pipeline_config)
+        self.force = force
+
+    def run_stage(self, stage: str, inputs: List[str], sources, params: dict, compute: Callable[[], Dict[str, Any]]) -> Tuple[str, Mapping]:
+        """
+        This function returns the key and the outputs of a stage, computing them only when they are not cached.
+        """
+        try:
+            key = self.stage_cache.key(stage, inputs, sources, params)
+
+            if self.pipeline_config.enabled and not self.force:
+                cached = self.stage_cache.load(stage, key)
+                if cached is not None:
+                    logging.info(f'Stage {stage} is up to date, using the cached outputs {key}.')
+                    return key, cached
+
+            logging.info(f'Running stage {stage}.')
+            start = time.perf_counter()
+            outputs = compute()
+            logging.info(f'Stage {stage} finished in {time.perf_counter() - start:.1f}s.')
+
+            if self.pipeline_config.enabled:
+                self.stage_cache.save(stage, key, outputs)
+            return key, outputs
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def run(self) -> dict:
+        """
+        This function runs the whole training pipeline and publishes the serving artifacts.
+        """
+        try:
+            data_ingestor = DataIngestion()
+            data_processor = DataProcessing()
+            model_trainer = ModelTrainer()
+            model_evaluator = ModelEvaluation()
+
+            # the ingestion is never skipped, an updated document does not change the count or the ids of
+            # the collection, so the following stages are keyed on the content of what was fetched instead
+            logging.info('Running stage data_ingestion.')
+            with StageProfiler('data_ingestion') as profiler:
+                # applying the raw schema in memory, this is what a round trip through the raw artifacts did
+                df = apply_schema(data_ingestor.load_data(), RAW_SCHEMA)
+                train_df, test_df = data_ingestor.split_data(df)
+                profiler.rows = len(df)
+            raw = {'train': train_df, 'test': test_df}
+
+            ingestion_config = data_ingestor.ingestion_config
+            ingestion_key = self.stage_cache.key(
+                'data_ingestion',
+                [frames_hash(raw)],
+                [DataIngestion, artifact_io],
+                {'test_size': ingestion_config.test_size, 'random_state': ingestion_config.random_state, 'split_mode': ingestion_config.split_mode}
+            )
+
+            def process() -> Dict[str, Any]:
+                train_processed, test_processed, preprocessor = data_processor.process_data(raw['train'], raw['test'])
+                return {'train': train_processed, 'test': test_processed, 'preprocessor': preprocessor}
+
+            processing_key, processed = self.run_stage(
+                'data_preprocessing',
+                [ingestion_key],
+                [DataProcessing, transformers],
+                {},
+                process
+            )
+
+            params = model_trainer.load_params()
+            training_key, trained = self.run_stage(
+                'model_trainer',
+                [processing_key],
+                [ModelTrainer, smote_cache],
+                params,
+                lambda: {'model': model_trainer.train_model(params, processed['train'])}
+            )
+
+            _, evaluated = self.run_stage(
+                'model_evaluation',
+                [processing_key, training_key],
+                [ModelEvaluation, scoring],
+                {'threshold': model_evaluator.scoring_config.threshold},
+                lambda: {'metrics': model_evaluator.evaluate_model(processed['test'], trained['model'])}
+            )
+
+            # publishing the same files the DVC stages write for serving
+            preprocessor = processed['preprocessor']
+            with open(model_trainer.model_trainer_config.processor_path, 'wb') as f:
+                pickle.dump(preprocessor, f)
+            model_trainer.save_model(trained['model'], preprocessor)
+
+            metrics = evaluated['metrics']
+            logging.info(f'Training pipeline completed: {metrics}')
+            return metrics
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs the training pipeline in one process, skipping the unchanged stages.')
+    parser.add_argument('--force', action='store_true', help='run every stage even when its outputs are cached')
+    args = parser.parse_args()
+
+    training_pipeline = TrainingPipeline(force=args.force)
+    training_pipeline.run()
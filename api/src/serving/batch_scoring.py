@@ -0,0 +1,168 @@
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import IO, TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Tuple
+
+from src.logger import logging
+from src.serving.metrics import serving_metrics
+from src.serving.model_registry import LoadedModel
+from src.utils.scoring import apply_threshold, predict_positive_proba
+
+# pandas is imported by the functions that need it, importing the API does not load it
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
+@dataclass
+class BatchScoringConfig:
+    """
+    This is a special class which is used for the batch prediction settings.
+    """
+    # number of records transformed and scored together, bounds the memory of a batch request
+    chunk_size: int = field(default_factory=lambda: int(os.getenv('BATCH_CHUNK_SIZE', '5000')))
+    # uploads larger than this are spooled to a temporary file instead of memory
+    spool_max_size: int = field(default_factory=lambda: int(os.getenv('BATCH_SPOOL_MAX_SIZE', str(16 * 1024 * 1024))))
+
+def read_csv_chunks(file: IO[bytes], chunk_size: int):
+    import pandas as pd
+    return pd.read_csv(file, chunksize=chunk_size)
+
+def read_ndjson_chunks(file: IO[bytes], chunk_size: int):
+    import pandas as pd
+    return pd.read_json(file, lines=True, chunksize=chunk_size)
+
+UPLOAD_READERS = {
+    'text/csv': read_csv_chunks,
+    'application/x-ndjson': read_ndjson_chunks,
+    'application/jsonl': read_ndjson_chunks
+}
+
+class UploadError(ValueError):
+    """
+    This is a special class which is used for uploads that cannot be scored, with the HTTP status to answer with.
+    """
+    def __init__(self, message: str, status_code: int = 400) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+def frame_probabilities(loaded: LoadedModel, df: 'pd.DataFrame') -> 'np.ndarray':
+    """
+    This function runs the inference pipeline once over all the rows of the frame.
+    """
+    pipeline = loaded.pipeline
+
+    # the same steps as pipeline.predict_proba, run separately so each phase is timed
+    start = time.perf_counter()
+    X = pipeline[:-1].transform(df[list(pipeline.feature_names_in_)])
+    start = serving_metrics.observe_phase('transform', start)
+    probabilities = predict_positive_proba(pipeline[-1], X)
+    serving_metrics.observe_phase('predict_proba', start)
+
+    serving_metrics.predictions.inc(len(df), ('sklearn',))
+    serving_metrics.batch_rows.observe(len(df))
+    return probabilities
+
+def score_frame(loaded: LoadedModel, df: 'pd.DataFrame', threshold: float) -> Tuple['np.ndarray', 'np.ndarray']:
+    """
+    This function returns the labels and probabilities for all the rows of the frame.
+    """
+    probabilities = frame_probabilities(loaded, df)
+    return apply_threshold(probabilities, threshold), probabilities
+
+def score_records(loaded: LoadedModel, records: List[Dict[str, Any]]) -> 'np.ndarray':
+    """
+    This function scores a list of customer dicts as a single frame.
+    """
+    import pandas as pd
+    return frame_probabilities(loaded, pd.DataFrame(records))
+
+def iter_frame_chunks(records: list, chunk_size: int) -> Iterator['pd.DataFrame']:
+    """
+    This function turns a list of customer dicts into frames of at most chunk_size rows.
+    """
+    import pandas as pd
+    for start in range(0, len(records), chunk_size):
+        yield pd.DataFrame(records[start:start + chunk_size])
+
+def scored_chunk_lines(chunk: 'pd.DataFrame', predictions: 'np.ndarray', probabilities: 'np.ndarray', threshold: float) -> bytes:
+    """
+    This function formats the results of one scored frame as NDJSON lines.
+    """
+    import pandas as pd
+    results = pd.DataFrame({
+        'prediction': predictions.astype(int),
+        'probability': probabilities.astype(float),
+        'threshold': threshold
+    })
+    # keeping the id of uploaded rows so the results can be joined back
+    if 'customerID' in chunk.columns:
+        results.insert(0, 'customerID', chunk['customerID'].to_numpy())
+
+    return ''.join(json.dumps(row) + '\n' for row in results.to_dict('records')).encode()
+
+def open_scored_upload(loaded: LoadedModel, file: IO[bytes], content_type: str, chunk_size: int, threshold: float) -> Iterator[bytes]:
+    """
+    This function parses, checks and scores the first chunk of an uploaded CSV or NDJSON file, then
+    returns an iterator scoring the rest of the file lazily, chunk_size rows at a time.
+
+    Once the response has started streaming its status can no longer change, so an empty, malformed,
+    incomplete or unscorable upload has to be rejected here. The file is closed when it is rejected.
+    """
+    reader = None
+    try:
+        try:
+            reader = UPLOAD_READERS[content_type](file, chunk_size)
+            first = next(iter(reader), None)
+        except ValueError as e:
+            # the pandas parsing errors, including an empty CSV, are all ValueErrors
+            raise UploadError(f'The upload could not be parsed: {e}') from e
+
+        if first is None or first.empty:
+            raise UploadError('The upload contains no records.')
+
+        missing = [column for column in loaded.pipeline.feature_names_in_ if column not in first.columns]
+        if missing:
+            raise UploadError(f'The upload is missing the required columns {missing}.', status_code=422)
+
+        try:
+            first_lines = scored_chunk_lines(first, *score_frame(loaded, first, threshold), threshold)
+        except (ValueError, TypeError) as e:
+            # a value the pipeline cannot convert, for example a tenure that is not a number
+            raise UploadError(f'The upload contains invalid values: {e}', status_code=422) from e
+
+        return iter_scored_upload(loaded, reader, first_lines, len(first), file, threshold)
+
+    except Exception:
+        if reader is not None:
+            reader.close()
+        file.close()
+        raise
+
+def iter_scored_upload(loaded: LoadedModel, reader, first_lines: bytes, first_rows: int, file: IO[bytes], threshold: float) -> Iterator[bytes]:
+    """
+    This function yields the already scored first chunk, then reads and scores the rest of the upload.
+
+    An error in a later chunk ends the stream with an error record, so the client can tell a failed
+    upload from a complete one and knows how many rows were scored before it.
+    """
+    rows = first_rows
+    try:
+        with reader:
+            yield first_lines
+            for chunk in reader:
+                lines = scored_chunk_lines(chunk, *score_frame(loaded, chunk, threshold), threshold)
+                rows += len(chunk)
+                yield lines
+    except Exception as e:
+        logging.error(f'Scoring the upload failed after {rows} rows: {e}')
+        yield (json.dumps({'error': str(e), 'rows_scored': rows}) + '\n').encode()
+    finally:
+        file.close()
+
+def iter_scored_chunks(loaded: LoadedModel, chunks: Iterable['pd.DataFrame'], threshold: float) -> Iterator[bytes]:
+    """
+    This function scores the frames one at a time and yields the results as NDJSON lines.
+    """
+    for chunk in chunks:
+        yield scored_chunk_lines(chunk, *score_frame(loaded, chunk, threshold), threshold)
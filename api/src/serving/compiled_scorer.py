@@ -0,0 +1,185 @@
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+# numpy, pandas and sklearn are imported inside the functions that build and check the scorer, so
+# importing the API stays cheap and scoring a record never needs them
+
+class CompiledScorer:
+    """
+    This class scores a single customer dict without pandas or the sklearn transformer machinery.
+
+    The fitted preprocessor and LogisticRegression are folded into plain Python lookup tables:
+    every scaled numeric feature becomes one weight and a constant added to the intercept, and every
+    one-hot encoded feature becomes a category -> coefficient dict. Scoring a record is then a handful
+    of dict lookups and multiply-adds followed by the logistic function.
+    """
+    def __init__(self, intercept: float, numeric_terms: List[Tuple], categorical_tables: Dict[str, Dict[Any, float]], binary_columns: Tuple = ()) -> None:
+        # numeric_terms are (column, fill_value, log_transform, weight) tuples
+        self.intercept = intercept
+        self.numeric_terms = numeric_terms
+        self.categorical_tables = categorical_tables
+        self.binary_columns = frozenset(binary_columns)
+
+        from src.utils.transformers import BINARY_VALUES
+        self.binary_values = BINARY_VALUES
+
+    @classmethod
+    def from_artifacts(cls, preprocessor, model) -> 'CompiledScorer':
+        """
+        This function compiles a fitted preprocessor and model, and raises ValueError for anything it cannot fold.
+        """
+        import numpy as np
+        from sklearn.impute import SimpleImputer
+        from sklearn.linear_model import LogisticRegression, SGDClassifier
+        from sklearn.pipeline import Pipeline
+        from sklearn.preprocessing import FunctionTransformer, OneHotEncoder, StandardScaler
+
+        from src.utils.transformers import CategoryNormalizer
+
+        # an SGDClassifier trained with the log loss is the same sigmoid over a linear function
+        logistic = isinstance(model, LogisticRegression) or (isinstance(model, SGDClassifier) and model.loss == 'log_loss')
+        if not logistic or model.coef_.shape[0] != 1:
+            raise ValueError(f'Only binary logistic models can be compiled, got {type(model).__name__}.')
+
+        # the saved preprocessor is the cleaning step followed by the ColumnTransformer
+        normalizer = None
+        column_transformer = preprocessor
+        if isinstance(preprocessor, Pipeline):
+            *cleaning_steps, (_, column_transformer) = preprocessor.steps
+            for _, step in cleaning_steps:
+                if not isinstance(step, CategoryNormalizer) or normalizer is not None:
+                    raise ValueError(f'Unsupported cleaning step {type(step).__name__}.')
+                normalizer = step
+
+        coef = model.coef_[0]
+        # intercept_ is a plain 0.0 when the model was fitted without an intercept
+        intercept = float(np.atleast_1d(model.intercept_)[0])
+        numeric_terms = []
+        categorical_tables = {}
+
+        for name, transformer, columns in column_transformer.transformers_:
+            if transformer == 'drop' or len(columns) == 0:
+                continue
+            if transformer == 'passthrough':
+                raise ValueError(f'Passthrough columns are not supported: {columns}.')
+
+            steps = [step for _, step in transformer.steps] if isinstance(transformer, Pipeline) else [transformer]
+            output_indices = column_transformer.output_indices_[name]
+            weights = coef[output_indices]
+
+            if isinstance(steps[-1], OneHotEncoder):
+                if len(steps) != 1:
+                    raise ValueError(f'The {name} encoder must be the only step of its pipeline.')
+                encoder = steps[0]
+                if encoder.drop_idx_ is not None or encoder.handle_unknown != 'ignore' or getattr(encoder, '_infrequent_enabled', False):
+                    raise ValueError(f'The {name} encoder uses unsupported options.')
+
+                offset = 0
+                for column, categories in zip(columns, encoder.categories_):
+                    categorical_tables[column] = {
+                        category: float(weight) for category, weight in zip(categories.tolist(), weights[offset:offset + len(categories)])
+                    }
+                    offset += len(categories)
+                continue
+
+            fill_values = [None] * len(columns)
+            log_transform = False
+            scaler = None
+            for position, step in enumerate(steps):
+                if isinstance(step, SimpleImputer) and step.strategy == 'constant' and position == 0:
+                    fill_values = [float(value) for value in step.statistics_]
+                elif isinstance(step, FunctionTransformer) and step.func is np.log1p and scaler is None:
+                    log_transform = True
+                elif isinstance(step, StandardScaler) and position == len(steps) - 1:
+                    scaler = step
+                else:
+                    raise ValueError(f'Unsupported step {type(step).__name__} in the {name} pipeline.')
+
+            for i, column in enumerate(columns):
+                weight = float(weights[i])
+                if scaler is not None:
+                    # w * (x - mean) / scale == (w / scale) * x - (w / scale) * mean
+                    if scaler.with_std:
+                        weight = weight / float(scaler.scale_[i])
+                    if scaler.with_mean:
+                        intercept -= weight * float(scaler.mean_[i])
+                numeric_terms.append((column, fill_values[i], log_transform, weight))
+
+        # a replaced value scores exactly like the value it is replaced with
+        if normalizer is not None:
+            for column, replacements in normalizer.replacements_.items():
+                if column in categorical_tables:
+                    table = categorical_tables[column]
+                    for value, replacement in replacements.items():
+                        table[value] = table.get(replacement, 0.0)
+
+        return cls(intercept, numeric_terms, categorical_tables, normalizer.binary_columns if normalizer is not None else ())
+
+    def decision_function(self, record: Dict[str, Any]) -> float:
+        """
+        This function returns the raw logit of the positive class for one record.
+        """
+        z = self.intercept
+        for column, fill_value, log_transform, weight in self.numeric_terms:
+            value = record[column]
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                # Yes/No columns are mapped to 1/0 by the cleaning step, anything else is coerced to NaN
+                value = self.binary_values.get(str(value).lower(), math.nan) if column in self.binary_columns else math.nan
+            if value != value:
+                if fill_value is None:
+                    raise ValueError(f'Missing value for {column}.')
+                value = fill_value
+            if log_transform:
+                value = math.log1p(value)
+            z += weight * value
+
+        for column, table in self.categorical_tables.items():
+            # unknown categories are encoded as all zeros, exactly like handle_unknown='ignore'
+            z += table.get(record[column], 0.0)
+
+        return z
+
+    def predict_proba(self, record: Dict[str, Any]) -> float:
+        """
+        This function returns the probability of the positive class for one record.
+        """
+        z = self.decision_function(record)
+        if z >= 0:
+            return 1.0 / (1.0 + math.exp(-z))
+        exp_z = math.exp(z)
+        return exp_z / (1.0 + exp_z)
+
+    def probe_records(self, columns: List[str]) -> List[Dict[str, Any]]:
+        """
+        This function builds records that cover every known category plus an unknown one.
+        """
+        size = max([len(table) for table in self.categorical_tables.values()] + [1]) + 1
+        records = []
+        for i in range(size):
+            record = {column: 0 for column in columns}
+            for j, (column, fill_value, _, _) in enumerate(self.numeric_terms):
+                record[column] = math.nan if fill_value is not None and i == size - 1 else float(i * 17 + j * 3)
+            for column, table in self.categorical_tables.items():
+                categories = list(table)
+                record[column] = categories[i] if i < len(categories) else '__unknown__'
+            records.append(record)
+        return records
+
+    def check_parity(self, preprocessor, model, records: Optional[List[Dict[str, Any]]] = None, tolerance: float = 1e-9) -> float:
+        """
+        This function compares the compiled scores with the sklearn path and raises ValueError if they differ.
+        """
+        import numpy as np
+        import pandas as pd
+
+        columns = list(preprocessor.feature_names_in_)
+        records = records or self.probe_records(columns)
+        expected = model.predict_proba(preprocessor.transform(pd.DataFrame(records, columns=columns)))[:, 1]
+        actual = np.array([self.predict_proba(record) for record in records])
+
+        max_difference = float(np.max(np.abs(expected - actual)))
+        if max_difference > tolerance:
+            raise ValueError(f'Compiled scorer differs from the sklearn path by {max_difference}.')
+        return max_difference
@@ -0,0 +1,296 @@
+import bisect
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+"""
+This module keeps the runtime metrics of the API and renders them in the Prometheus text format.
+
+Every thread updates its own shard of a metric, so recording a value on the hot path is a dict update
+without any lock. The shards are only summed when /metrics is scraped. Each worker process keeps its
+own metrics, so with several uvicorn or gunicorn workers every worker has to be scraped.
+"""
+
+# seconds, from a compiled single prediction to a large batch upload
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 5000, 10000)
+
+@dataclass
+class MetricsConfig:
+    """
+    This is a special class which is used for the telemetry settings of the API.
+    """
+    enabled: bool = field(default_factory=lambda: os.getenv('METRICS_ENABLED', '1') == '1')
+
+def escape_label_value(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(names: Sequence[str], values: Sequence, extra: str = '') -> str:
+    """
+    This function renders a label set, escaping the values as the text format requires.
+    """
+    pairs = [f'{name}="{escape_label_value(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+class ShardedMetric:
+    """
+    This is a special class which is used for keeping one shard of a metric per thread.
+
+    A thread only ever writes to its own dict. The list of shards is the only shared state and it is
+    only locked the first time a thread records a value.
+    """
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        self._lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def _snapshots(self) -> List[dict]:
+        with self._lock:
+            shards = list(self._shards)
+        # dict.copy does not release the GIL, so a shard is never copied half way through an update
+        return [shard.copy() for shard in shards]
+
+class Counter(ShardedMetric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1.0, labels: Tuple = ()) -> None:
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0.0) + amount
+
+    def collect(self) -> Dict[Tuple, float]:
+        totals: Dict[Tuple, float] = {}
+        for shard in self._snapshots():
+            for labels, value in shard.items():
+                totals[labels] = totals.get(labels, 0.0) + value
+        return totals
+
+    def render(self) -> List[str]:
+        return [f'{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}' for labels, value in sorted(self.collect().items())]
+
+class Histogram(ShardedMetric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, labels: Tuple = ()) -> None:
+        shard = self._shard()
+        state = shard.get(labels)
+        if state is None:
+            # one count per bucket, one for +Inf, then the sum
+            state = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        # le buckets, a value equal to a bound belongs to that bucket
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def collect(self) -> Dict[Tuple, list]:
+        totals: Dict[Tuple, list] = {}
+        for shard in self._snapshots():
+            for labels, state in shard.items():
+                state = list(state)
+                if labels in totals:
+                    totals[labels] = [a + b for a, b in zip(totals[labels], state)]
+                else:
+                    totals[labels] = state
+        return totals
+
+    def render(self) -> List[str]:
+        lines = []
+        bounds = [format_value(bound) for bound in self.buckets] + ['+Inf']
+        for labels, state in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(bounds, state[:-1]):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{format_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(self.labelnames, labels)} {format_value(state[-1])}')
+            lines.append(f'{self.name}_count{format_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+class Gauge:
+    """
+    This is a special class which is used for values read at scrape time, such as the loaded model version.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], callback: Callable[[], Dict[Tuple, float]]) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        return [f'{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}' for labels, value in sorted(self.callback().items())]
+
+class CallbackCounter(Gauge):
+    """
+    This is a special class which is used for counters kept by another component and read at scrape time.
+    """
+    kind = 'counter'
+
+class MetricsRegistry:
+    """
+    This class holds the metrics of the process and renders all of them for /metrics.
+    """
+    def __init__(self) -> None:
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str], callback: Callable[[], Dict[Tuple, float]]) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def callback_counter(self, name: str, documentation: str, labelnames: Sequence[str], callback: Callable[[], Dict[Tuple, float]]) -> CallbackCounter:
+        return self.register(CallbackCounter(name, documentation, labelnames, callback))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+class ServingMetrics:
+    """
+    This class defines the metrics recorded by the API.
+    """
+    def __init__(self, config: Optional[MetricsConfig] = None) -> None:
+        self.metrics_config = config or MetricsConfig()
+        self.metrics_registry = MetricsRegistry()
+        self.request_seconds = self.metrics_registry.histogram(
+            'http_request_duration_seconds', 'End-to-end latency of the requests, including streamed bodies.', ('endpoint', 'method')
+        )
+        self.requests = self.metrics_registry.counter('http_requests_total', 'Requests handled.', ('endpoint', 'method', 'status'))
+        self.errors = self.metrics_registry.counter('http_request_errors_total', 'Requests answered with a 4xx or 5xx status.', ('endpoint', 'status'))
+        self.phase_seconds = self.metrics_registry.histogram(
+            'churn_prediction_phase_seconds', 'Time spent in each phase of a prediction.', ('phase',)
+        )
+        self.predictions = self.metrics_registry.counter('churn_predictions_total', 'Records scored, by scoring path.', ('path',))
+        self.batch_rows = self.metrics_registry.histogram(
+            'churn_scoring_batch_rows', 'Records per vectorized scoring call.', (), BATCH_SIZE_BUCKETS
+        )
+
+    def track_model(self, model_registry) -> None:
+        """
+        This function exposes the version and load time of the model served by the registry.
+        """
+        def version() -> Dict[Tuple, float]:
+            return {(model_registry.current().version,): 1.0} if model_registry.is_loaded else {}
+
+        def loaded_at() -> Dict[Tuple, float]:
+            return {(): model_registry.current().loaded_at} if model_registry.is_loaded else {}
+
+        self.metrics_registry.gauge('churn_model_info', 'Version of the loaded inference pipeline.', ('version',), version)
+        self.metrics_registry.gauge('churn_model_loaded_timestamp_seconds', 'Unix time the inference pipeline was loaded.', (), loaded_at)
+
+    def track_cache(self, prediction_cache) -> None:
+        """
+        This function exposes the hit, miss and eviction counters and the size of the prediction cache.
+        """
+        def requests() -> Dict[Tuple, float]:
+            hits, misses, _, _, _ = prediction_cache.stats()
+            return {('hit',): hits, ('miss',): misses}
+
+        def evictions() -> Dict[Tuple, float]:
+            _, _, evicted, expired, _ = prediction_cache.stats()
+            return {('capacity',): evicted, ('expired',): expired}
+
+        self.metrics_registry.callback_counter('churn_prediction_cache_requests_total', 'Prediction cache lookups, by result.', ('result',), requests)
+        self.metrics_registry.callback_counter('churn_prediction_cache_evictions_total', 'Entries removed from the prediction cache, by reason.', ('reason',), evictions)
+        self.metrics_registry.gauge('churn_prediction_cache_entries', 'Entries in the prediction cache.', (), lambda: {(): prediction_cache.stats()[4]})
+
+    def observe_phase(self, phase: str, start: float) -> float:
+        """
+        This function records the time since start for a phase and returns the current time.
+        """
+        now = time.perf_counter()
+        self.phase_seconds.observe(now - start, (phase,))
+        return now
+
+    def observe_validation(self, request) -> None:
+        """
+        This function records the time from the start of the request to the handler, which is spent
+        reading the body, parsing it and validating it against the request model.
+        """
+        start = getattr(request.state, 'metrics_start', None)
+        if start is not None:
+            self.observe_phase('validation', start)
+
+    def render(self) -> str:
+        return self.metrics_registry.render()
+
+class MetricsMiddleware:
+    """
+    This is a special class which is used for recording the latency, status and errors of every request.
+
+    It is a plain ASGI middleware rather than an http middleware, so the latency of a streamed response
+    covers the whole body and not only the time to the first byte.
+    """
+    def __init__(self, app, metrics: ServingMetrics) -> None:
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        scope.setdefault('state', {})['metrics_start'] = start
+        status = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # the route template keeps the label set bounded, unknown paths are grouped together
+            route = scope.get('route')
+            endpoint = getattr(route, 'path', 'unmatched')
+            method = scope['method']
+
+            self.metrics.request_seconds.observe(time.perf_counter() - start, (endpoint, method))
+            self.metrics.requests.inc(1, (endpoint, method, str(status)))
+            if status >= 400:
+                self.metrics.errors.inc(1, (endpoint, str(status)))
+
+# shared by the app and the scoring functions, one per worker process
+serving_metrics = ServingMetrics()
@@ -0,0 +1,127 @@
+import asyncio
+import os
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from src.logger import logging
+
+@dataclass
+class MicroBatcherConfig:
+    """
+    This is a special class which is used for the micro-batching settings of /predict.
+    """
+    enabled: bool = field(default_factory=lambda: os.getenv('MICRO_BATCH_ENABLED', '0') == '1')
+    # a batch is scored as soon as it has max_batch_size records or its oldest record waited max_wait_ms
+    max_batch_size: int = field(default_factory=lambda: int(os.getenv('MICRO_BATCH_MAX_SIZE', '64')))
+    max_wait_ms: float = field(default_factory=lambda: float(os.getenv('MICRO_BATCH_MAX_WAIT_MS', '2')))
+
+class MicroBatcher:
+    """
+    This class coalesces concurrent single-record requests into one vectorized scoring call.
+
+    Requests put their record on a queue and await a future. A single background task drains the
+    queue into batches, scores each batch with score_batch on a worker thread and resolves the
+    futures in order, so throughput grows with concurrency instead of with the threadpool size.
+
+    Every record is queued with the model snapshot of its request, and a batch holding records of
+    several snapshots, around a reload, is scored once per snapshot, so a record is never scored by
+    another model than the one its request started with.
+    """
+    def __init__(self, score_batch: Callable[[Any, List[Dict[str, Any]]], Sequence[float]], config: Optional[MicroBatcherConfig] = None) -> None:
+        self.batcher_config = config or MicroBatcherConfig()
+        self.score_batch = score_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """
+        This function starts the background task, it must be called from the serving event loop.
+        """
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+        logging.info(f'Micro-batching enabled, up to {self.batcher_config.max_batch_size} records or {self.batcher_config.max_wait_ms}ms per batch.')
+
+    async def stop(self) -> None:
+        """
+        This function stops the background task and fails the requests that are still queued.
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        pending = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        self._fail(pending, RuntimeError('The micro-batcher was stopped.'))
+
+    @staticmethod
+    def _fail(batch: List[Tuple[Any, Dict[str, Any], asyncio.Future]], error: Exception) -> None:
+        for _, _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    async def submit(self, snapshot: Any, record: Dict[str, Any]) -> float:
+        """
+        This function queues one record with the snapshot it has to be scored with and waits for its probability.
+        """
+        if self._task is None:
+            raise RuntimeError('The micro-batcher has not been started.')
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((snapshot, record, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[Any, Dict[str, Any], asyncio.Future]]:
+        """
+        This function waits for the first record and then fills the batch until it is full or the wait is over.
+        """
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.batcher_config.max_wait_ms / 1000
+
+        while len(batch) < self.batcher_config.max_batch_size:
+            # taking whatever is already queued without yielding to the loop
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+
+            # grouped by snapshot identity in arrival order, there is a single group unless a reload happened
+            groups: Dict[int, List[Tuple[Any, Dict[str, Any], asyncio.Future]]] = {}
+            for item in batch:
+                groups.setdefault(id(item[0]), []).append(item)
+
+            for group in groups.values():
+                snapshot = group[0][0]
+                records = [record for _, record, _ in group]
+
+                try:
+                    probabilities = await asyncio.to_thread(self.score_batch, snapshot, records)
+                except asyncio.CancelledError:
+                    self._fail(batch, RuntimeError('The micro-batcher was stopped.'))
+                    raise
+                except Exception as e:
+                    self._fail(group, e)
+                    continue
+
+                for (_, _, future), probability in zip(group, probabilities):
+                    # the request may have been cancelled by the client while waiting
+                    if not future.done():
+                        future.set_result(float(probability))
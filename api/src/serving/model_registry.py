@@ -0,0 +1,171 @@
+import asyncio
+import hashlib
+import os
+import pickle
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Optional, Tuple
+
+from src.logger import logging
+from src.exception import CustomException
+from src.serving.compiled_scorer import CompiledScorer
+
+@dataclass
+class ModelRegistryConfig:
+    """
+    This is a special class which is used for the paths of the serving artifacts and the reload settings.
+    """
+    # cleaning, column transformations and model saved together by the model_trainer stage
+    inference_pipeline_path: str = field(default_factory=lambda: os.getenv('INFERENCE_PIPELINE_PATH', os.path.join('artifacts', 'models', 'inference_pipeline.pkl')))
+    # seconds between artifact checks, 0 disables the file watcher
+    watch_interval: float = field(default_factory=lambda: float(os.getenv('MODEL_WATCH_INTERVAL', '0')))
+    # compile the artifacts into the pandas-free scorer used for single predictions
+    compile_scorer: bool = field(default_factory=lambda: os.getenv('COMPILED_SCORER', '1') == '1')
+    # token expected by the /reload endpoint as a bearer token, the endpoint is disabled while it is empty
+    reload_token: str = field(default_factory=lambda: os.getenv('MODEL_RELOAD_TOKEN', ''))
+
+@dataclass(frozen=True)
+class LoadedModel:
+    """
+    This is an immutable snapshot of the artifacts used to serve a single request.
+    """
+    pipeline: Any
+    version: str
+    loaded_at: float
+    scorer: Optional[CompiledScorer] = None
+
+class ModelRegistry:
+    """
+    This class loads the inference pipeline once and keeps it in memory for the API.
+
+    The loaded pipeline is published as one LoadedModel snapshot, so a reload only swaps a single
+    reference and a request that already holds the old snapshot keeps using it consistently.
+    """
+    def __init__(self, config: Optional[ModelRegistryConfig] = None) -> None:
+        self.registry_config = config or ModelRegistryConfig()
+        self._loaded: Optional[LoadedModel] = None
+        self._fingerprint: Optional[Tuple] = None
+        self._pending_fingerprint: Optional[Tuple] = None
+        self._reload_lock = threading.Lock()
+        self._listeners: List[Callable[[LoadedModel], None]] = []
+
+    def _artifact_fingerprint(self) -> Tuple:
+        """
+        This function returns the modification time and size of the inference pipeline.
+        """
+        stat = os.stat(self.registry_config.inference_pipeline_path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def load(self) -> LoadedModel:
+        """
+        This function loads the inference pipeline from disk and swaps it in atomically.
+        """
+        try:
+            with self._reload_lock:
+                fingerprint = self._artifact_fingerprint()
+
+                logging.info('Loading the serving artifacts.')
+                with open(self.registry_config.inference_pipeline_path, 'rb') as f:
+                    pipeline_bytes = f.read()
+                pipeline = pickle.loads(pipeline_bytes)
+
+                loaded = LoadedModel(
+                    pipeline=pipeline,
+                    version=hashlib.sha256(pipeline_bytes).hexdigest()[:12],
+                    loaded_at=time.time(),
+                    scorer=self._compile(pipeline) if self.registry_config.compile_scorer else None
+                )
+
+                # a single reference assignment, readers see either the old or the new snapshot
+                self._loaded = loaded
+                self._fingerprint = fingerprint
+                self._pending_fingerprint = None
+                logging.info(f'Serving artifacts loaded, model version {loaded.version}.')
+
+                # the new snapshot is already served, a failing listener is reported but does not undo the reload
+                for listener in self._listeners:
+                    try:
+                        listener(loaded)
+                    except Exception as e:
+                        logging.error(f'A listener of the model registry failed for version {loaded.version}: {e}')
+
+                return loaded
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def _compile(self, pipeline) -> Optional[CompiledScorer]:
+        """
+        This function builds the compiled scorer and only returns it if it matches the sklearn path.
+        """
+        try:
+            preprocessor, model = pipeline[:-1], pipeline[-1]
+            scorer = CompiledScorer.from_artifacts(preprocessor, model)
+            max_difference = scorer.check_parity(preprocessor, model)
+            logging.info(f'Compiled scorer ready, max difference from sklearn {max_difference:.2e}.')
+            return scorer
+        except ValueError as e:
+            logging.warning(f'Falling back to the sklearn path for single predictions: {e}')
+            return None
+
+    def on_load(self, listener: Callable[[LoadedModel], None]) -> None:
+        """
+        This function registers a callback run with every newly loaded snapshot, after it is swapped in.
+        """
+        self._listeners.append(listener)
+
+    def current(self) -> LoadedModel:
+        """
+        This function returns the snapshot that should be used for the current request.
+        """
+        loaded = self._loaded
+        if loaded is None:
+            raise RuntimeError('The model registry has not been loaded yet.')
+        return loaded
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded is not None
+
+    def reload_if_changed(self) -> bool:
+        """
+        This function reloads the artifacts when they have changed on disk and returns True if it did.
+
+        A change is only picked up once the files look the same on two consecutive checks, so a
+        model that is still being written by the model_trainer stage is never loaded half way.
+        """
+        try:
+            fingerprint = self._artifact_fingerprint()
+        except OSError:
+            # the artifacts are being replaced, check again on the next tick
+            return False
+
+        if fingerprint == self._fingerprint:
+            self._pending_fingerprint = None
+            return False
+
+        if fingerprint != self._pending_fingerprint:
+            self._pending_fingerprint = fingerprint
+            return False
+
+        try:
+            self.load()
+            return True
+        except CustomException as e:
+            logging.error(f'Reloading the serving artifacts failed, keeping version {self.current().version}: {e}')
+            return False
+
+    async def watch(self) -> None:
+        """
+        This function polls the artifacts in the background and hot-reloads them when they change.
+        """
+        interval = self.registry_config.watch_interval
+        logging.info(f'Watching the serving artifacts every {interval}s.')
+        while True:
+            await asyncio.sleep(interval)
+            # any error is logged and the next tick tries again, the watcher must never stop silently
+            try:
+                await asyncio.to_thread(self.reload_if_changed)
+            except Exception as e:
+                logging.error(f'Checking the serving artifacts failed, trying again in {interval}s: {e}')
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+@dataclass
+class PredictionCacheConfig:
+    """
+    This is a special class which is used for the settings of the /predict result cache.
+    """
+    enabled: bool = field(default_factory=lambda: os.getenv('PREDICTION_CACHE_ENABLED', '0') == '1')
+    # an entry is a 16 byte key and a probability, about 200 bytes with the dict overhead
+    max_entries: int = field(default_factory=lambda: int(os.getenv('PREDICTION_CACHE_MAX_ENTRIES', '100000')))
+    # seconds a cached probability is served for, 0 keeps it until it is evicted or the model changes
+    ttl_seconds: float = field(default_factory=lambda: float(os.getenv('PREDICTION_CACHE_TTL', '300')))
+
+def cache_key(record: Dict[str, Any], version: str) -> bytes:
+    """
+    This function hashes the validated fields of a customer and the model version into a fixed size key.
+
+    The fields are serialised with sorted keys, so the same customer gives the same key whatever the
+    order of the fields in the request. Only the digest is kept, never the payload.
+    """
+    canonical = json.dumps(record, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.blake2b(f'{version}\0{canonical}'.encode(), digest_size=16).digest()
+
+class PredictionCache:
+    """
+    This class keeps the most recently used probabilities of /predict in memory, in an LRU with a TTL.
+
+    The model version is part of every key, and the cache is also cleared when the registry loads a
+    new model, so a probability computed by a previous model is never served and never kept around.
+    """
+    def __init__(self, config: Optional[PredictionCacheConfig] = None) -> None:
+        self.cache_config = config or PredictionCacheConfig()
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: bytes) -> Optional[float]:
+        """
+        This function returns the cached probability of a key, or None when it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, probability = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return probability
+
+    def put(self, key: bytes, probability: float) -> None:
+        """
+        This function stores a probability, evicting the least recently used entries beyond max_entries.
+        """
+        ttl = self.cache_config.ttl_seconds
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl if ttl > 0 else None, probability)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.cache_config.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self, *_) -> None:
+        """
+        This function drops every entry, it is registered as a listener of the model registry.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Tuple[int, int, int, int, int]:
+        """
+        This function returns the hits, misses, evictions, expirations and current number of entries.
+        """
+        with self._lock:
+            return self.hits, self.misses, self.evictions, self.expirations, len(self._entries)
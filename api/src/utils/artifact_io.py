@@ -0,0 +1,208 @@
+import os
+from typing import Dict, Iterator, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+"""
+This is the artifact I/O layer used by every pipeline stage to hand datasets to the next one.
+The format is picked from the file extension, so each stage only deals with paths.
+"""
+
+# format used for new artifacts, csv keeps the original behaviour
+ARTIFACT_FORMAT = os.getenv('ARTIFACT_FORMAT', 'parquet')
+
+EXTENSIONS = {
+    'parquet': '.parquet',
+    'feather': '.feather',
+    'csv': '.csv'
+}
+
+# raw customer records as they come out of MongoDB, TotalCharges stays a string until it is cleaned
+RAW_SCHEMA: Dict[str, str] = {
+    'customerID': 'object',
+    'gender': 'object',
+    'SeniorCitizen': 'int64',
+    'Partner': 'object',
+    'Dependents': 'object',
+    'tenure': 'int64',
+    'PhoneService': 'object',
+    'MultipleLines': 'object',
+    'InternetService': 'object',
+    'OnlineSecurity': 'object',
+    'OnlineBackup': 'object',
+    'DeviceProtection': 'object',
+    'TechSupport': 'object',
+    'StreamingTV': 'object',
+    'StreamingMovies': 'object',
+    'Contract': 'object',
+    'PaperlessBilling': 'object',
+    'PaymentMethod': 'object',
+    'MonthlyCharges': 'float64',
+    'TotalCharges': 'object',
+    'Churn': 'object'
+}
+
+def processed_schema(columns) -> Dict[str, str]:
+    """
+    This function returns the schema of a processed dataset, float64 features and an int64 target.
+    """
+    return {column: 'int64' if column == 'Churn' else 'float64' for column in columns}
+
+def artifact_path(directory: str, name: str, fmt: Optional[str] = None) -> str:
+    """
+    This function builds the path of an artifact in the configured format.
+    """
+    return os.path.join(directory, name + EXTENSIONS[fmt or ARTIFACT_FORMAT])
+
+def artifact_format(path: str) -> str:
+    """
+    This function returns the format of an artifact from its extension.
+    """
+    extension = os.path.splitext(path)[1]
+    for fmt, fmt_extension in EXTENSIONS.items():
+        if extension == fmt_extension:
+            return fmt
+    raise ValueError(f'Unknown artifact format for {path}.')
+
+def apply_schema(df: pd.DataFrame, schema: Optional[Dict[str, str]]) -> pd.DataFrame:
+    """
+    This function casts the columns covered by the schema, the other columns are left untouched.
+    """
+    if schema is None:
+        return df
+    return df.astype({column: dtype for column, dtype in schema.items() if column in df.columns})
+
+def save_frame(df: pd.DataFrame, path: str, schema: Optional[Dict[str, str]] = None) -> None:
+    """
+    This function writes a DataFrame to path in the format given by its extension.
+    """
+    df = apply_schema(df, schema)
+    fmt = artifact_format(path)
+    if fmt == 'parquet':
+        df.to_parquet(path, index=False)
+    elif fmt == 'feather':
+        # uncompressed so the file can be memory-mapped without decoding
+        df.reset_index(drop=True).to_feather(path, compression='uncompressed')
+    else:
+        df.to_csv(path, index=False, header=True)
+
+def load_frame(path: str, schema: Optional[Dict[str, str]] = None, memory_map: bool = False) -> pd.DataFrame:
+    """
+    This function reads an artifact into a DataFrame, memory-mapping the file for the binary formats if asked.
+    """
+    fmt = artifact_format(path)
+    if fmt == 'parquet':
+        df = pq.read_table(path, memory_map=memory_map).to_pandas()
+    elif fmt == 'feather':
+        df = feather.read_table(path, memory_map=memory_map).to_pandas()
+    else:
+        # CSV does not keep the dtypes, so the schema is applied while parsing
+        df = pd.read_csv(path, dtype=schema)
+    return apply_schema(df, schema)
+
+def iter_frames(path: str, chunk_size: int, schema: Optional[Dict[str, str]] = None) -> Iterator[pd.DataFrame]:
+    """
+    This function reads an artifact lazily in DataFrames of at most chunk_size rows.
+    """
+    fmt = artifact_format(path)
+    if fmt == 'csv':
+        with pd.read_csv(path, dtype=schema, chunksize=chunk_size) as reader:
+            for chunk in reader:
+                yield apply_schema(chunk, schema)
+        return
+
+    if fmt == 'parquet':
+        batches = pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=chunk_size)
+    else:
+        batches = feather.read_table(path, memory_map=True).to_batches(max_chunksize=chunk_size)
+    for batch in batches:
+        yield apply_schema(batch.to_pandas(), schema)
+
+def arrow_type(dtype: str) -> pa.DataType:
+    """
+    This function returns the arrow type of a declared pandas dtype, object columns hold strings.
+    """
+    if dtype == 'object':
+        return pa.string()
+    return pa.from_numpy_dtype(pd.api.types.pandas_dtype(dtype))
+
+class FrameWriter:
+    """
+    This class appends DataFrame chunks to one artifact, so a stage can write its output while streaming.
+    """
+    def __init__(self, path: str, schema: Optional[Dict[str, str]] = None) -> None:
+        self.path = path
+        self.schema = schema
+        self.fmt = artifact_format(path)
+        self.columns = None
+        self._arrow_schema = None
+        self._writer = None
+        self._file = None
+
+    def __enter__(self) -> 'FrameWriter':
+        if self.fmt == 'csv':
+            self._file = open(self.path, 'w', newline='')
+        return self
+
+    def arrow_schema(self, df: pd.DataFrame) -> pa.Schema:
+        """
+        This function returns the arrow schema of the file, the declared dtypes win over the ones inferred from df.
+
+        An empty or all-null column is inferred as null by arrow, which would reject the values of later chunks.
+        """
+        inferred = pa.Schema.from_pandas(df, preserve_index=False) if len(df) else None
+        fields = []
+        for column in self.columns:
+            if self.schema is not None and column in self.schema:
+                fields.append(pa.field(column, arrow_type(self.schema[column])))
+            elif inferred is not None:
+                fields.append(inferred.field(column))
+            else:
+                fields.append(pa.field(column, pa.string()))
+        return pa.schema(fields)
+
+    def _open_writer(self, arrow_schema: pa.Schema) -> None:
+        self._arrow_schema = arrow_schema
+        if self.fmt == 'parquet':
+            self._writer = pq.ParquetWriter(self.path, arrow_schema)
+        else:
+            self._writer = pa.ipc.new_file(self.path, arrow_schema)
+
+    def write(self, df: pd.DataFrame) -> None:
+        """
+        This function appends one chunk, the columns of the first chunk are used for the whole file.
+        """
+        header = self.columns is None
+        if header:
+            self.columns = df.columns.tolist()
+        df = apply_schema(df.reindex(columns=self.columns), self.schema)
+
+        if self.fmt == 'csv':
+            df.to_csv(self._file, index=False, header=header)
+            return
+
+        # an empty chunk adds nothing, the file is opened with the first chunk that has rows
+        if df.empty:
+            return
+
+        if self._writer is None:
+            self._open_writer(self.arrow_schema(df))
+        self._writer.write_table(pa.Table.from_pandas(df, schema=self._arrow_schema, preserve_index=False))
+
+    def __exit__(self, *exc) -> None:
+        if self.columns is None and self.schema is not None:
+            self.columns = list(self.schema)
+
+        # a stream without any row still produces a readable file with the expected columns
+        if self._file is not None:
+            if self._file.tell() == 0 and self.columns is not None:
+                pd.DataFrame(columns=self.columns).to_csv(self._file, index=False, header=True)
+            self._file.close()
+        elif self._writer is None and self.columns is not None:
+            self._open_writer(self.arrow_schema(pd.DataFrame(columns=self.columns)))
+
+        if self._writer is not None:
+            self._writer.close()
@@ -1,16 +1,104 @@
+import argparse
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
 import pandas as pd
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
 from src.configurations.mongodb_connection import MongoDBConnection
+from src.exception import CustomException
+from src.logger import logging
+from src.utils.artifact_io import RAW_SCHEMA
+
+"""
+This is the bulk loader used to seed and refresh the MongoDB collection from a CSV file.
+
+    python src/utils/data_pusher.py WA_Fn-UseC_-Telco-Customer-Churn.csv --concurrency 8
 
-def upload_to_mongodb() -> None:
+Every upserted document is stamped by the server with the time of its write in UPDATED_AT_FIELD. An
+updated document keeps its _id, so the incremental ingestion uses that field as its watermark to see
+the refreshed customers.
+"""
 
+# set on every write, the ingestion drops it so it never becomes a feature column
+UPDATED_AT_FIELD = 'updated_at'
+
+def upsert_batch(collection, records, id_column: str) -> dict:
+    """
+    This function updates or inserts one batch of records, keyed by id_column, in a single unordered bulk write.
     """
-    This function is a helper function which is used to push the csv data to the remote MongoDB Atlas
+    # the time is taken by the server while it writes each document, not by this client before sending the
+    # batch, so batches in flight at the same time cannot be stamped in a different order than they are written
+    operations = [
+        UpdateOne({id_column: record[id_column]}, {'$set': record, '$currentDate': {UPDATED_AT_FIELD: True}}, upsert=True)
+        for record in records
+    ]
+    result = collection.bulk_write(operations, ordered=False)
+    return {'matched': result.matched_count, 'modified': result.modified_count, 'upserted': result.upserted_count}
+
+def upload_to_mongodb(csv_path: str, collection_name: str = 'churn-prediction', id_column: str = 'customerID',
+                      chunk_size: int = 50000, batch_size: int = 1000, concurrency: int = 4) -> dict:
     """
+    This function streams a CSV file into the collection, upserting every row on id_column.
+
+    The file is read chunk_size rows at a time and each chunk is cut into batches of batch_size rows,
+    with at most concurrency batches in flight, so memory stays bounded whatever the size of the file.
+    """
+    try:
+        mongodb = MongoDBConnection()
+        collection = mongodb.database[collection_name]
+
+        # without an index on the key every upsert would scan the whole collection
+        try:
+            collection.create_index(id_column, unique=True)
+        except OperationFailure as e:
+            logging.warning(f'Could not create a unique index on {id_column}, using a plain one: {e}')
+            collection.create_index(id_column)
+
+        totals = {'rows': 0, 'matched': 0, 'modified': 0, 'upserted': 0}
+        start = time.perf_counter()
+
+        def collect(futures) -> None:
+            for future in futures:
+                for key, value in future.result().items():
+                    totals[key] += value
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            pending = set()
+            with pd.read_csv(csv_path, dtype=RAW_SCHEMA, chunksize=chunk_size) as reader:
+                for chunk in reader:
+                    records = chunk.to_dict('records')
+                    for offset in range(0, len(records), batch_size):
+                        # waiting for a batch to finish before reading further keeps the memory bounded
+                        if len(pending) >= concurrency:
+                            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            collect(done)
+                        pending.add(executor.submit(upsert_batch, collection, records[offset:offset + batch_size], id_column))
+                    totals['rows'] += len(records)
+                    logging.info(f'{totals["rows"]} rows sent.')
+            collect(pending)
+
+        elapsed = time.perf_counter() - start
+        report = dict(totals, seconds=elapsed, rows_per_second=totals['rows'] / elapsed if elapsed > 0 else 0.0)
+        logging.info(
+            f'{report["rows"]} rows loaded in {elapsed:.2f}s ({report["rows_per_second"]:.0f} rows/sec), '
+            f'{report["upserted"]} inserted, {report["modified"]} updated.'
+        )
+        return report
+
+    except Exception as e:
+        raise CustomException(e, sys)
 
-    mongodb = MongoDBConnection()
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Upserts a CSV file into the MongoDB collection in concurrent batches.')
+    parser.add_argument('csv_path', help='path of the CSV file to load')
+    parser.add_argument('--collection', default='churn-prediction', help='name of the collection')
+    parser.add_argument('--id-column', default='customerID', help='column used as the upsert key')
+    parser.add_argument('--chunk-size', type=int, default=50000, help='rows read from the file at a time')
+    parser.add_argument('--batch-size', type=int, default=1000, help='rows per bulk write')
+    parser.add_argument('--concurrency', type=int, default=4, help='bulk writes in flight at the same time')
+    args = parser.parse_args()
 
-    df = pd.read_csv('C:/Users/ansar/Desktop/Workspace/Personal/MLOPs/Customer Churn Prediction/api/WA_Fn-UseC_-Telco-Customer-Churn.csv')
-    data = df.to_dict('records')
-    collection = mongodb.database['churn-prediction']
-    collection.insert_many(data)
-    print('Data Stored in MongoDB.')
\ No newline at end of file
+    upload_to_mongodb(args.csv_path, args.collection, args.id_column, args.chunk_size, args.batch_size, args.concurrency)
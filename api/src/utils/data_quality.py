@@ -0,0 +1,155 @@
+from typing import Callable, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+"""
+This module computes the outlier bounds of every numeric column at once, either on a DataFrame
+in one vectorized pass or over a stream of chunks with running moments and a quantile sketch.
+"""
+
+Z_THRESHOLD = 3.0
+IQR_FACTOR = 1.5
+
+def numeric_columns(df: pd.DataFrame, columns: Optional[List[str]] = None) -> List[str]:
+    """
+    This function returns the columns to check, all the numeric columns when none are given.
+    """
+    return list(columns) if columns is not None else df.select_dtypes(include='number').columns.tolist()
+
+def bounds_from_statistics(columns, mean, std, q1, q3, z_threshold: float = Z_THRESHOLD, iqr_factor: float = IQR_FACTOR) -> pd.DataFrame:
+    """
+    This function turns the per column statistics into z-score and IQR bounds.
+
+    A column without spread gets NaN bounds, so it never has outliers with either method.
+    """
+    std = np.where(std > 0, std, np.nan)
+    iqr = np.where(np.isnan(std), np.nan, q3 - q1)
+    return pd.DataFrame({
+        'mean': mean,
+        'std': std,
+        'z_low': mean - z_threshold * std,
+        'z_high': mean + z_threshold * std,
+        'q1': q1,
+        'q3': q3,
+        'iqr_low': q1 - iqr_factor * iqr,
+        'iqr_high': q3 + iqr_factor * iqr
+    }, index=pd.Index(columns, name='column'))
+
+def outlier_bounds(df: pd.DataFrame, columns: Optional[List[str]] = None, z_threshold: float = Z_THRESHOLD, iqr_factor: float = IQR_FACTOR) -> pd.DataFrame:
+    """
+    This function computes the z-score and IQR bounds of all the columns in one pass over the matrix.
+    """
+    columns = numeric_columns(df, columns)
+    values = df[columns].to_numpy(dtype=np.float64)
+
+    # the same estimators as pandas, sample standard deviation and linear quantiles, NaNs are skipped
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nanmean(values, axis=0)
+        std = np.nanstd(values, axis=0, ddof=1)
+        q1, q3 = np.nanquantile(values, [0.25, 0.75], axis=0)
+    return bounds_from_statistics(columns, mean, std, q1, q3, z_threshold, iqr_factor)
+
+def outlier_mask(df: pd.DataFrame, bounds: pd.DataFrame, method: str = 'z') -> pd.DataFrame:
+    """
+    This function returns a boolean DataFrame marking the values outside the bounds of the given method.
+    """
+    if method not in ('z', 'iqr'):
+        raise ValueError(f'Unknown outlier method {method}, expected z or iqr.')
+    values = df[bounds.index].to_numpy(dtype=np.float64)
+    low = bounds[f'{method}_low'].to_numpy()
+    high = bounds[f'{method}_high'].to_numpy()
+    # comparisons with NaN bounds are False, so columns without spread are never flagged
+    return pd.DataFrame((values < low) | (values > high), index=df.index, columns=bounds.index)
+
+def outlier_report(df: pd.DataFrame, columns: Optional[List[str]] = None, z_threshold: float = Z_THRESHOLD, iqr_factor: float = IQR_FACTOR) -> pd.DataFrame:
+    """
+    This function returns the bounds, outlier counts and outlier rates of every column for both methods.
+    """
+    bounds = outlier_bounds(df, columns, z_threshold, iqr_factor)
+    counts = df[bounds.index].notna().sum().to_numpy()
+    report = bounds.copy()
+    for method in ('z', 'iqr'):
+        report[f'{method}_outliers'] = outlier_mask(df, bounds, method).sum().to_numpy()
+        report[f'{method}_rate'] = report[f'{method}_outliers'] / np.maximum(counts, 1)
+    return report
+
+class StreamingProfile:
+    """
+    This class accumulates the statistics needed for the outlier bounds over a stream of chunks.
+
+    The mean and variance are merged chunk by chunk with the parallel Welford update, so they are exact.
+    The quartiles come from a uniform reservoir sample of the rows, so they are approximate and their
+    error shrinks with reservoir_size, while the memory stays bounded whatever the size of the data.
+    """
+    def __init__(self, columns: List[str], reservoir_size: int = 100000, random_state: int = 42) -> None:
+        self.columns = list(columns)
+        self.reservoir_size = reservoir_size
+        self.rng = np.random.default_rng(random_state)
+        self.count = np.zeros(len(self.columns))
+        self.mean = np.zeros(len(self.columns))
+        self.m2 = np.zeros(len(self.columns))
+        self.rows_seen = 0
+        self.reservoir = np.empty((0, len(self.columns)))
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        """
+        This function adds one chunk to the running moments and to the reservoir.
+        """
+        values = chunk[self.columns].to_numpy(dtype=np.float64)
+        if len(values) == 0:
+            return
+
+        # merging the moments of the chunk into the running ones
+        with np.errstate(invalid='ignore', divide='ignore'):
+            count = np.sum(~np.isnan(values), axis=0)
+            mean = np.where(count > 0, np.nansum(values, axis=0) / np.maximum(count, 1), 0.0)
+            m2 = np.nansum((values - mean) ** 2, axis=0)
+        total = self.count + count
+        delta = mean - self.mean
+        safe_total = np.maximum(total, 1)
+        self.mean = self.mean + delta * count / safe_total
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * count / safe_total
+        self.count = total
+
+        # reservoir sampling, row i of the stream replaces a random slot with probability size / (i + 1)
+        free = max(self.reservoir_size - len(self.reservoir), 0)
+        if free:
+            self.reservoir = np.vstack([self.reservoir, values[:free]])
+        positions = self.rows_seen + np.arange(free, len(values))
+        slots = (self.rng.random(len(positions)) * (positions + 1)).astype(np.int64)
+        keep = slots < self.reservoir_size
+        self.reservoir[slots[keep]] = values[free:][keep]
+        self.rows_seen += len(values)
+
+    def bounds(self, z_threshold: float = Z_THRESHOLD, iqr_factor: float = IQR_FACTOR) -> pd.DataFrame:
+        """
+        This function returns the bounds in the same layout as outlier_bounds.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(self.count > 0, self.mean, np.nan)
+            std = np.sqrt(np.where(self.count > 1, self.m2 / np.maximum(self.count - 1, 1), np.nan))
+            quartiles = np.nanquantile(self.reservoir, [0.25, 0.75], axis=0) if len(self.reservoir) else np.full((2, len(self.columns)), np.nan)
+        q1, q3 = quartiles
+        return bounds_from_statistics(self.columns, mean, std, q1, q3, z_threshold, iqr_factor)
+
+def streaming_outlier_report(chunks: Callable[[], Iterable[pd.DataFrame]], columns: List[str], reservoir_size: int = 100000, z_threshold: float = Z_THRESHOLD, iqr_factor: float = IQR_FACTOR) -> pd.DataFrame:
+    """
+    This function builds the outlier report in two passes over the chunks, one for the bounds and one for the counts.
+
+    chunks is called once per pass and must return a fresh iterator over the same data.
+    """
+    profile = StreamingProfile(columns, reservoir_size)
+    for chunk in chunks():
+        profile.update(chunk)
+    bounds = profile.bounds(z_threshold, iqr_factor)
+
+    report = bounds.copy()
+    outliers = {method: np.zeros(len(columns), dtype=np.int64) for method in ('z', 'iqr')}
+    for chunk in chunks():
+        for method in outliers:
+            outliers[method] += outlier_mask(chunk, bounds, method).sum().to_numpy()
+    for method, counts in outliers.items():
+        report[f'{method}_outliers'] = counts
+        report[f'{method}_rate'] = counts / np.maximum(profile.count, 1)
+    return report
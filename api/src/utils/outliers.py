@@ -1,22 +1,15 @@
-def z_score_outliers(df, feature):
-    if df[feature].std() == 0:
-        return 
-    
-    low = df[feature].mean() - 3 * df[feature].std()
-    high = df[feature].mean() + 3 * df[feature].std()
+from src.utils.data_quality import outlier_bounds, outlier_mask
 
-    return df[(df[feature] > high) | (df[feature] < low)]
+def z_score_outliers(df, feature):
+    """
+    This function returns the rows whose feature is more than 3 standard deviations from the mean.
+    """
+    bounds = outlier_bounds(df, [feature])
+    return df[outlier_mask(df, bounds, 'z')[feature]]
 
 def iqr_outliers(df, feature):
-    if df[feature].std() == 0:
-        return 0
-    
-    Q1 = df[feature].quantile(0.25)
-    Q3 = df[feature].quantile(0.75)
-
-    IQR = Q3 - Q1
-
-    low = Q1 - 1.5 * IQR
-    high = Q3 + 1.5 * IQR
-
-    return df[(df[feature] > high) | (df[feature] < low)]
\ No newline at end of file
+    """
+    This function returns the rows whose feature is more than 1.5 IQR outside the quartiles.
+    """
+    bounds = outlier_bounds(df, [feature])
+    return df[outlier_mask(df, bounds, 'iqr')[feature]]
@@ -0,0 +1,239 @@
+import cProfile
+import functools
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from src.logger import logging
+
+"""
+This module measures where the pipeline spends its time and memory. A stage is wrapped with the
+StageProfiler context manager or the profiled decorator, which record the wall time, CPU time,
+peak resident memory and throughput of the stage and log them as MLflow metrics.
+
+    PROFILER=cprofile python src/pipeline.py
+"""
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, the peak memory is then only known from the sampling
+    resource = None
+
+@dataclass
+class ProfilingConfig:
+    """
+    This is a special class which is used for the settings of the stage profiling.
+    """
+    enabled: bool = field(default_factory=lambda: os.getenv('PROFILING_ENABLED', '1') == '1')
+    log_to_mlflow: bool = field(default_factory=lambda: os.getenv('PROFILING_MLFLOW', '1') == '1')
+    # empty for no report, cprofile writes a .prof file per stage and pyinstrument an .html one
+    profiler: str = field(default_factory=lambda: os.getenv('PROFILER', ''))
+    output_dir: str = field(default_factory=lambda: os.getenv('PROFILING_DIR', os.path.join('artifacts', 'profiles')))
+    # seconds between two reads of the resident memory while a stage runs
+    sample_interval: float = field(default_factory=lambda: float(os.getenv('PROFILING_SAMPLE_INTERVAL', '0.05')))
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def current_rss() -> Optional[int]:
+    """
+    This function returns the resident memory of the process in bytes, or None where /proc is not available.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+def max_rss() -> Optional[int]:
+    """
+    This function returns the highest resident memory of the process since it started, in bytes.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+class RssSampler:
+    """
+    This is a special class which is used for following the peak resident memory of a stage.
+
+    The process wide peak from getrusage never goes down, so it cannot tell the peak of a stage that runs
+    after a bigger one. A background thread reads the current resident memory instead.
+    """
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            rss = current_rss()
+            if rss is not None and rss > self.peak:
+                self.peak = rss
+
+    def start(self) -> None:
+        if self.peak is not None:
+            self._thread = threading.Thread(target=self._sample, name='rss-sampler', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> Optional[int]:
+        """
+        This function stops the sampling and returns the peak in bytes.
+        """
+        if self._thread is None:
+            return max_rss()
+        self._stop.set()
+        self._thread.join()
+        rss = current_rss()
+        return max(self.peak, rss) if rss is not None else self.peak
+
+class StageProfiler:
+    """
+    This is a special class which is used for profiling one stage of the pipeline.
+
+    The metrics are logged to the active MLflow run, so a stage profiled inside its own run keeps them
+    next to its params, and to a new <stage>_profile run of the Churn Prediction experiment otherwise.
+    Set rows before the block ends to get the throughput.
+    """
+    # cProfile and pyinstrument can only follow one stage at a time, nested stages are not profiled
+    _profiling = threading.local()
+
+    def __init__(self, stage: str, rows: Optional[int] = None, config: Optional[ProfilingConfig] = None) -> None:
+        self.profiling_config = config or ProfilingConfig()
+        self.stage = stage
+        self.rows = rows
+        self.metrics: dict = {}
+        self._profiler = None
+
+    def __enter__(self) -> 'StageProfiler':
+        if not self.profiling_config.enabled:
+            return self
+
+        self._start_profiler()
+        self._sampler = RssSampler(self.profiling_config.sample_interval)
+        self._sampler.start()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if not self.profiling_config.enabled:
+            return
+
+        wall_time = time.perf_counter() - self._wall_start
+        cpu_time = time.process_time() - self._cpu_start
+        peak_rss = self._sampler.stop()
+        report_path = self._stop_profiler()
+
+        # a failed stage is not reported, its partial timings would only skew the comparisons
+        if exc_type is not None:
+            return
+
+        self.metrics = {
+            f'{self.stage}_wall_time': wall_time,
+            f'{self.stage}_cpu_time': cpu_time
+        }
+        if peak_rss is not None:
+            self.metrics[f'{self.stage}_peak_rss_mb'] = peak_rss / 1e6
+        if self.rows is not None:
+            self.metrics[f'{self.stage}_rows'] = self.rows
+            self.metrics[f'{self.stage}_rows_per_second'] = self.rows / wall_time if wall_time > 0 else 0.0
+
+        logging.info(
+            f'Stage {self.stage}: {wall_time:.2f}s wall, {cpu_time:.2f}s CPU'
+            + (f', peak RSS {peak_rss / 1e6:.0f} MB' if peak_rss is not None else '')
+            + (f', {self.metrics[f"{self.stage}_rows_per_second"]:.0f} rows/sec' if self.rows is not None else '')
+            + '.'
+        )
+
+        if self.profiling_config.log_to_mlflow:
+            self._log_to_mlflow(report_path)
+
+    def _start_profiler(self) -> None:
+        name = self.profiling_config.profiler
+        if not name or getattr(self._profiling, 'active', False):
+            return
+
+        if name == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+                self._profiler = Profiler()
+            except ImportError:
+                logging.warning('pyinstrument is not installed, falling back to cProfile.')
+                name = 'cprofile'
+        if name == 'cprofile':
+            self._profiler = cProfile.Profile()
+        elif self._profiler is None:
+            logging.warning(f'Unknown profiler {name}, expected cprofile or pyinstrument.')
+            return
+
+        self._profiling.active = True
+        if isinstance(self._profiler, cProfile.Profile):
+            self._profiler.enable()
+        else:
+            self._profiler.start()
+
+    def _stop_profiler(self) -> Optional[str]:
+        """
+        This function stops the profiler and writes its report, returning the path of the report.
+        """
+        if self._profiler is None:
+            return None
+
+        self._profiling.active = False
+        os.makedirs(self.profiling_config.output_dir, exist_ok=True)
+        if isinstance(self._profiler, cProfile.Profile):
+            self._profiler.disable()
+            path = os.path.join(self.profiling_config.output_dir, f'{self.stage}.prof')
+            self._profiler.dump_stats(path)
+        else:
+            self._profiler.stop()
+            path = os.path.join(self.profiling_config.output_dir, f'{self.stage}.html')
+            with open(path, 'w') as f:
+                f.write(self._profiler.output_html())
+        self._profiler = None
+
+        logging.info(f'Profile of stage {self.stage} written to {path}.')
+        return path
+
+    def _log_to_mlflow(self, report_path: Optional[str]) -> None:
+        # profiling must never fail a stage, a tracking server that is down only costs the metrics
+        try:
+            import mlflow
+
+            def log() -> None:
+                mlflow.log_metrics(self.metrics)
+                if report_path is not None:
+                    mlflow.log_artifact(report_path, artifact_path='profiles')
+
+            if mlflow.active_run() is not None:
+                log()
+            else:
+                mlflow.set_experiment('Churn Prediction')
+                with mlflow.start_run(run_name=f'{self.stage}_profile'):
+                    log()
+        except Exception as e:
+            logging.warning(f'Could not log the profile of stage {self.stage} to MLflow: {e}')
+
+def profiled(stage: str, rows: Optional[Callable[[Any], int]] = None) -> Callable:
+    """
+    This function is a decorator that profiles every call of the function as the given stage.
+
+    rows receives the return value and returns the number of rows the call processed.
+    """
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with StageProfiler(stage) as profiler:
+                result = function(*args, **kwargs)
+                if rows is not None:
+                    profiler.rows = rows(result)
+            return result
+        return wrapper
+    return decorator
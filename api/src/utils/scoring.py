@@ -0,0 +1,35 @@
+import os
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Tuple
+
+# the API imports this module, numpy is only loaded when a threshold is first applied
+if TYPE_CHECKING:
+    import numpy as np
+
+@dataclass
+class ScoringConfig:
+    """
+    This is a special class which is used for the decision threshold shared by the API and the evaluation.
+    """
+    # probability of churn at or above which a customer is labelled as churning
+    threshold: float = field(default_factory=lambda: float(os.getenv('PREDICTION_THRESHOLD', '0.5')))
+
+def predict_positive_proba(model, X) -> 'np.ndarray':
+    """
+    This function returns the probability of the positive class with a single predict_proba call.
+    """
+    return model.predict_proba(X)[:, 1]
+
+def apply_threshold(probabilities, threshold: float) -> 'np.ndarray':
+    """
+    This function turns churn probabilities into 0/1 labels using the decision threshold.
+    """
+    import numpy as np
+    return (np.asarray(probabilities) >= threshold).astype(int)
+
+def score(model, X, threshold: float) -> Tuple['np.ndarray', 'np.ndarray']:
+    """
+    This function computes the probabilities once and derives the labels from them.
+    """
+    probabilities = predict_positive_proba(model, X)
+    return apply_threshold(probabilities, threshold), probabilities
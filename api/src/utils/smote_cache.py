@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Tuple
+
+import imblearn
+import numpy as np
+import pandas as pd
+from imblearn.over_sampling import SMOTE
+from sklearn.neighbors import NearestNeighbors
+
+from src.logger import logging
+
+@dataclass
+class SmoteCacheConfig:
+    """
+    This is a special class which is used for the settings of the SMOTE resampling and of its cache.
+    """
+    cache_dir: str = field(default_factory=lambda: os.getenv('SMOTE_CACHE_DIR', os.path.join('artifacts', 'cache', 'smote')))
+    enabled: bool = field(default_factory=lambda: os.getenv('SMOTE_CACHE_ENABLED', '1') == '1')
+    # the least recently used entries are removed once the cache is bigger than this
+    max_size_bytes: int = field(default_factory=lambda: int(os.getenv('SMOTE_CACHE_MAX_BYTES', str(512 * 1024 * 1024))))
+    k_neighbors: int = 5
+    random_state: int = 42
+    # cores used by the nearest-neighbour search, -1 uses all of them
+    n_jobs: int = field(default_factory=lambda: int(os.getenv('SMOTE_JOBS', '-1')))
+
+def dataset_hash(X: pd.DataFrame, y: pd.Series) -> str:
+    """
+    This function returns a content hash of a dataset, independent of the file format it was read from.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([list(map(str, X.columns)), str(y.name)]).encode())
+    digest.update(pd.util.hash_pandas_object(X, index=False).to_numpy().tobytes())
+    digest.update(pd.util.hash_pandas_object(y, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+class SmoteCache:
+    """
+    This class applies SMOTE and keeps its output on disk, keyed by the dataset content and the SMOTE settings.
+
+    A training run on data that was already resampled, for example when only the model parameters
+    changed, loads the resampled matrix instead of running the nearest-neighbour search again.
+    """
+    def __init__(self, config: SmoteCacheConfig = None) -> None:
+        self.cache_config = config or SmoteCacheConfig()
+
+    def cache_key(self, X: pd.DataFrame, y: pd.Series) -> str:
+        """
+        This function combines the dataset hash with everything that changes the SMOTE output.
+        """
+        settings = {
+            'k_neighbors': self.cache_config.k_neighbors,
+            'random_state': self.cache_config.random_state,
+            'imblearn': imblearn.__version__
+        }
+        return hashlib.sha256((dataset_hash(X, y) + json.dumps(settings, sort_keys=True)).encode()).hexdigest()[:32]
+
+    def fit_resample(self, X: pd.DataFrame, y: pd.Series) -> Tuple[pd.DataFrame, pd.Series]:
+        """
+        This function returns the resampled dataset, from the cache when it is there.
+        """
+        if not self.cache_config.enabled:
+            return self._resample(X, y)
+
+        path = os.path.join(self.cache_config.cache_dir, self.cache_key(X, y) + '.npz')
+        if os.path.exists(path):
+            logging.info(f'Loading the resampled training dataset from {path}.')
+            with np.load(path) as data:
+                X_resampled, y_resampled = data['X'], data['y']
+            # the modification time is used as the last access time for the eviction
+            os.utime(path)
+            return pd.DataFrame(X_resampled, columns=X.columns), pd.Series(y_resampled, name=y.name)
+
+        X_resampled, y_resampled = self._resample(X, y)
+
+        os.makedirs(self.cache_config.cache_dir, exist_ok=True)
+        # written under a temporary name first so a reader never sees a partial file
+        temp_path = path + f'.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as f:
+            np.savez(f, X=X_resampled.to_numpy(), y=y_resampled.to_numpy())
+        os.replace(temp_path, path)
+        logging.info(f'Resampled training dataset cached at {path}.')
+
+        self.evict(keep=path)
+        return X_resampled, y_resampled
+
+    def _resample(self, X: pd.DataFrame, y: pd.Series) -> Tuple[pd.DataFrame, pd.Series]:
+        # SMOTE asks its neighbour estimator for k_neighbors + 1 neighbours, the sample itself included
+        neighbours = NearestNeighbors(n_neighbors=self.cache_config.k_neighbors + 1, n_jobs=self.cache_config.n_jobs)
+        smote = SMOTE(random_state=self.cache_config.random_state, k_neighbors=neighbours)
+        return smote.fit_resample(X, y)
+
+    def evict(self, keep: str = None) -> None:
+        """
+        This function removes the least recently used entries until the cache fits in max_size_bytes, keep is never removed.
+        """
+        entries = []
+        for name in os.listdir(self.cache_config.cache_dir):
+            if name.endswith('.npz') and os.path.join(self.cache_config.cache_dir, name) != keep:
+                stat = os.stat(os.path.join(self.cache_config.cache_dir, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries) + (os.path.getsize(keep) if keep else 0)
+        for _, size, name in sorted(entries):
+            if total <= self.cache_config.max_size_bytes:
+                break
+            os.remove(os.path.join(self.cache_config.cache_dir, name))
+            total -= size
+            logging.info(f'Evicted {name} from the SMOTE cache.')
@@ -0,0 +1,15 @@
+import numpy as np
+import pandas as pd
+
+# resolution of the hash buckets, a test_size of 0.2 puts buckets [0, 2000) in the testing set
+HASH_BUCKETS = 10000
+
+def hash_test_mask(keys: pd.Series, test_size: float) -> np.ndarray:
+    """
+    This function decides which rows belong to the testing set from a stable hash of their keys.
+
+    The assignment of a key never depends on the other rows or on their order, so the same customer
+    always lands in the same set, whether the data is split at once, chunk by chunk or incrementally.
+    """
+    hashes = pd.util.hash_pandas_object(keys.astype(str), index=False).to_numpy()
+    return (hashes % HASH_BUCKETS) < int(round(test_size * HASH_BUCKETS))
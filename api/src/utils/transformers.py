@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+
+BINARY_VALUES = {'yes': 1, 'no': 0, '1': 1, '0': 0}
+
+class CategoryNormalizer(BaseEstimator, TransformerMixin):
+    """
+    This transformer cleans the raw customer columns before they are scaled and encoded.
+
+    It collapses the 'No internet service' and 'No phone service' values into 'No' in the columns
+    where they were seen during fit, coerces the numeric columns stored as strings and maps the
+    Yes/No columns sent by the API to 1/0. It is the first step of the saved preprocessor, so
+    training and the API share the exact same cleaning.
+    """
+    def __init__(self, replacements=None, numeric_columns=('TotalCharges',), binary_columns=('SeniorCitizen',)) -> None:
+        self.replacements = replacements
+        self.numeric_columns = numeric_columns
+        self.binary_columns = binary_columns
+
+    def fit(self, X: pd.DataFrame, y=None) -> 'CategoryNormalizer':
+        replacements = self.replacements or {'No internet service': 'No', 'No phone service': 'No'}
+        categorical = X.columns[~X.columns.isin(list(self.numeric_columns) + list(self.binary_columns))]
+        categorical = X[categorical].select_dtypes(exclude='number').columns
+
+        # one vectorized comparison per replaced value over all the categorical columns
+        present = pd.DataFrame({value: X[categorical].eq(value).any() for value in replacements})
+
+        self.replacements_ = {
+            column: {value: replacements[value] for value in present.columns[present.loc[column]]}
+            for column in present.index[present.any(axis=1)]
+        }
+        self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        self.n_features_in_ = len(X.columns)
+        return self
+
+    def transform(self, X: pd.DataFrame) -> pd.DataFrame:
+        # a single replace call with a column -> {old: new} mapping for all the columns at once
+        X = X.replace(self.replacements_) if self.replacements_ else X.copy()
+        numeric_columns = [column for column in self.numeric_columns if column in X.columns]
+        if numeric_columns:
+            X[numeric_columns] = X[numeric_columns].apply(pd.to_numeric, errors='coerce')
+
+        # the training data stores these columns as 0/1 while the API receives Yes/No
+        for column in self.binary_columns:
+            if column in X.columns and not pd.api.types.is_numeric_dtype(X[column]):
+                X[column] = X[column].astype(str).str.lower().map(BINARY_VALUES)
+        return X
+
+    def get_feature_names_out(self, input_features=None) -> np.ndarray:
+        return self.feature_names_in_
@@ -0,0 +1,13 @@
+import os
+
+import pandas as pd
+import pytest
+
+DATASET_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'WA_Fn-UseC_-Telco-Customer-Churn.csv')
+
+@pytest.fixture(scope='session')
+def raw_df() -> pd.DataFrame:
+    """
+    The bundled Telco dataset as it is stored in MongoDB, TotalCharges kept as a string.
+    """
+    return pd.read_csv(DATASET_PATH, dtype={'TotalCharges': str})
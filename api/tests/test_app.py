@@ -0,0 +1,72 @@
+import importlib
+import json
+import os
+import pickle
+
+import pytest
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+
+from src.components.data_preprocessing import DataProcessing
+
+pytest.importorskip('httpx')
+from fastapi.testclient import TestClient
+
+@pytest.fixture(scope='module')
+def client(raw_df, tmp_path_factory):
+    # a small inference pipeline with the same steps as the one saved by model_trainer
+    processor = DataProcessing()
+    X, y = processor.separate_target(raw_df)
+    preprocessor = processor.build_preprocessor(X)
+    model = LogisticRegression(max_iter=1000).fit(preprocessor.fit_transform(X), y)
+    path = os.path.join(tmp_path_factory.mktemp('models'), 'inference_pipeline.pkl')
+    with open(path, 'wb') as f:
+        pickle.dump(Pipeline(preprocessor.steps + [('model', model)]), f)
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv('INFERENCE_PIPELINE_PATH', path)
+        monkeypatch.setenv('BATCH_CHUNK_SIZE', '50')
+        app = importlib.reload(importlib.import_module('app'))
+        with TestClient(app.app) as test_client:
+            yield test_client
+
+def upload(client, body: str, content_type: str = 'text/csv'):
+    return client.post('/predict/batch/file', content=body, headers={'content-type': content_type})
+
+def test_upload_is_scored(client, raw_df):
+    response = upload(client, raw_df.head(120).to_csv(index=False))
+    lines = [json.loads(line) for line in response.text.splitlines()]
+
+    assert response.status_code == 200
+    assert len(lines) == 120
+    assert lines[0]['customerID'] == raw_df['customerID'][0]
+
+@pytest.mark.parametrize('body, content_type, status_code', [
+    ('', 'text/csv', 400),
+    ('{"a": 1}\n{not json\n', 'application/x-ndjson', 400),
+    ('customerID,tenure\n1,2\n', 'text/csv', 422)
+])
+def test_invalid_upload_is_rejected(client, body, content_type, status_code):
+    assert upload(client, body, content_type).status_code == status_code
+
+def test_invalid_values_in_the_first_chunk_are_rejected(client, raw_df):
+    df = raw_df.head(10).astype({'tenure': object})
+    df.loc[3, 'tenure'] = 'abc'
+
+    response = upload(client, df.to_csv(index=False))
+
+    assert response.status_code == 422
+    assert 'invalid values' in response.json()['detail']
+
+def test_invalid_values_in_a_later_chunk_end_with_an_error_record(client, raw_df):
+    df = raw_df.head(120).astype({'tenure': object})
+    df.loc[75, 'tenure'] = 'abc'
+
+    response = upload(client, df.to_csv(index=False))
+    lines = [json.loads(line) for line in response.text.splitlines()]
+
+    # the first chunk of 50 rows is scored, the second one fails
+    assert response.status_code == 200
+    assert len(lines) == 51
+    assert lines[-1]['rows_scored'] == 50
+    assert 'error' in lines[-1]
@@ -0,0 +1,118 @@
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.configurations.mongodb_connection import MongoDBConnection
+from src.components.data_ingestion import DataIngestion
+from src.utils.artifact_io import load_frame
+
+mongomock = pytest.importorskip('mongomock')
+
+@pytest.fixture
+def collection(monkeypatch, tmp_path):
+    # the artifacts are written relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('MONGODB_DATABASE', 'churn')
+    client = mongomock.MongoClient()
+    MongoDBConnection.use_client(client)
+    yield client['churn']['churn-prediction']
+    MongoDBConnection.close()
+
+def make_ingestion(watermark_field: str = 'updated_at', lag: float = 0.0) -> DataIngestion:
+    data_ingestor = DataIngestion()
+    data_ingestor.ingestion_config.watermark_field = watermark_field
+    data_ingestor.ingestion_config.watermark_lag_seconds = lag
+    return data_ingestor
+
+def raw_dataset(data_ingestor: DataIngestion):
+    return load_frame(data_ingestor.ingestion_config.raw_data_path).set_index('customerID')
+
+def test_incremental_without_stamps(raw_df, collection):
+    # a collection seeded before data_pusher stamped the documents
+    collection.insert_many(raw_df.head(200).to_dict('records'))
+    data_ingestor = make_ingestion()
+
+    assert data_ingestor.save_data_incremental() == 200
+    assert 'updated_at' not in raw_dataset(data_ingestor).columns
+    # no value to move the watermark to, the next run fetches the whole collection again
+    assert not os.path.exists(data_ingestor.ingestion_config.watermark_path)
+    assert data_ingestor.save_data_incremental() == 200
+
+def test_incremental_lag_picks_up_late_commits(raw_df, collection):
+    now = datetime(2026, 1, 1, 12, 0, 0)
+    records = raw_df.head(100).to_dict('records')
+    collection.insert_many([dict(record, updated_at=now) for record in records])
+    data_ingestor = make_ingestion(lag=60)
+    data_ingestor.save_data_incremental()
+
+    # stamped before the watermark but only committed after the previous read
+    late = dict(raw_df.iloc[100].to_dict(), updated_at=now - timedelta(seconds=30))
+    collection.insert_one(late)
+
+    assert data_ingestor.save_data_incremental() == 101
+    assert late['customerID'] in raw_dataset(data_ingestor).index
+
+def stamp(collection, records) -> None:
+    # what data_pusher does with $currentDate, set explicitly because mongomock keeps the microseconds
+    # of $currentDate on updates while MongoDB stores dates with a millisecond precision
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    updated_at = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    for record in records:
+        collection.update_one({'customerID': record['customerID']}, {'$set': dict(record, updated_at=updated_at)}, upsert=True)
+    # the next write gets a later stamp
+    time.sleep(0.005)
+
+@pytest.fixture
+def delta_sizes(monkeypatch):
+    # counts the documents fetched by each incremental run
+    sizes = []
+    load_data_chunks = DataIngestion.load_data_chunks
+
+    def counting(self, *args, **kwargs):
+        chunks = list(load_data_chunks(self, *args, **kwargs))
+        sizes.append(sum(len(chunk) for chunk in chunks))
+        return iter(chunks)
+
+    monkeypatch.setattr(DataIngestion, 'load_data_chunks', counting)
+    return sizes
+
+def test_incremental_insert_update_and_no_change(raw_df, collection, delta_sizes):
+    records = raw_df.head(101).to_dict('records')
+    stamp(collection, records[:100])
+    data_ingestor = DataIngestion()
+    data_ingestor.ingestion_config.watermark_lag_seconds = 0
+    assert data_ingestor.ingestion_config.watermark_field == 'updated_at'
+
+    assert data_ingestor.save_data_incremental() == 100
+
+    # insert
+    stamp(collection, records[100:])
+    assert data_ingestor.save_data_incremental() == 101
+    assert records[100]['customerID'] in raw_dataset(data_ingestor).index
+
+    # update, the document keeps its _id
+    changed = dict(records[0], Churn='No' if records[0]['Churn'] == 'Yes' else 'Yes')
+    stamp(collection, [changed])
+    assert data_ingestor.save_data_incremental() == 101
+    assert raw_dataset(data_ingestor).loc[changed['customerID'], 'Churn'] == changed['Churn']
+
+    # no change
+    before = raw_dataset(data_ingestor)
+    assert data_ingestor.save_data_incremental() == 101
+    assert raw_dataset(data_ingestor).equals(before)
+
+    assert delta_sizes == [100, 1, 1, 0]
+    assert 'updated_at' not in before.columns
+
+def test_incremental_resyncs_an_id_watermark(raw_df, collection, delta_sizes):
+    stamp(collection, raw_df.head(50).to_dict('records'))
+    data_ingestor = make_ingestion(watermark_field='_id')
+    data_ingestor.save_data_incremental()
+
+    # switching to the updated_at default fetches the collection once instead of failing
+    data_ingestor = make_ingestion()
+    assert data_ingestor.save_data_incremental() == 50
+    assert data_ingestor.save_data_incremental() == 50
+    assert delta_sizes == [50, 50, 0]
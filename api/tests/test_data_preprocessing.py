@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.components.data_preprocessing import DataProcessing
+from src.utils.artifact_io import RAW_SCHEMA, save_frame
+
+def write_train(raw_df: pd.DataFrame, path: str, copies: int) -> None:
+    # every copy gets new ids and new TotalCharges values, the categories stay the same
+    frames = []
+    for copy in range(copies):
+        df = raw_df.copy()
+        df['customerID'] = df['customerID'] + f'-{copy}'
+        df['TotalCharges'] = (pd.to_numeric(df['TotalCharges'], errors='coerce').fillna(0) + copy * 0.01).round(2).astype(str)
+        frames.append(df)
+    save_frame(pd.concat(frames, ignore_index=True), path, RAW_SCHEMA)
+
+def fit_streaming(raw_df: pd.DataFrame, tmp_path, copies: int, monkeypatch):
+    path = os.path.join(tmp_path, f'train_{copies}.parquet')
+    write_train(raw_df, path, copies)
+
+    processor = DataProcessing()
+    processor.processor_config.chunk_size = 1000
+    frames = []
+    build = processor.vocabulary_frame
+    monkeypatch.setattr(processor, 'vocabulary_frame', lambda *args: frames.append(build(*args)) or frames[-1])
+    return processor.fit_preprocessor_streaming(path), frames[0]
+
+def test_vocabulary_frame_does_not_grow_with_the_data(raw_df, tmp_path, monkeypatch):
+    _, small = fit_streaming(raw_df, tmp_path, 1, monkeypatch)
+    _, large = fit_streaming(raw_df, tmp_path, 3, monkeypatch)
+
+    # bounded by the largest category, PaymentMethod has 4 values
+    assert len(small) == len(large) <= 4
+    assert set(small['PaymentMethod']) == set(raw_df['PaymentMethod'])
+
+def test_streaming_fit_matches_the_batch_fit(raw_df, tmp_path, monkeypatch):
+    preprocessor, _ = fit_streaming(raw_df, tmp_path, 1, monkeypatch)
+
+    processor = DataProcessing()
+    X, _ = processor.separate_target(raw_df)
+    batch = processor.build_preprocessor(X).fit(X)
+
+    assert list(preprocessor.get_feature_names_out()) == list(batch.get_feature_names_out())
+    np.testing.assert_allclose(preprocessor.transform(X), batch.transform(X), atol=1e-8)
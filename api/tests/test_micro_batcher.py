@@ -0,0 +1,30 @@
+import asyncio
+
+from src.serving.micro_batcher import MicroBatcher, MicroBatcherConfig
+
+class Snapshot:
+    def __init__(self, probability: float) -> None:
+        self.probability = probability
+
+def test_records_are_scored_with_their_own_snapshot():
+    calls = []
+
+    def score_batch(snapshot, records):
+        calls.append((snapshot, len(records)))
+        return [snapshot.probability] * len(records)
+
+    old, new = Snapshot(0.1), Snapshot(0.9)
+
+    async def main():
+        batcher = MicroBatcher(score_batch, MicroBatcherConfig(enabled=True, max_batch_size=64, max_wait_ms=50))
+        await batcher.start()
+        try:
+            # requests started before and after a reload land in the same batch
+            return await asyncio.gather(*[batcher.submit(old if i % 2 else new, {'i': i}) for i in range(10)])
+        finally:
+            await batcher.stop()
+
+    probabilities = asyncio.run(main())
+
+    assert probabilities == [0.1 if i % 2 else 0.9 for i in range(10)]
+    assert sorted((snapshot.probability, size) for snapshot, size in calls) == [(0.1, 5), (0.9, 5)]